@@ -1,20 +1,45 @@
 """Gemini SDK integration built on shared llm toolkit."""
 import logging
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
 from llm.config import RetryConfig, load_env_file
 from llm.exceptions import LLMConfigError, LLMTransportError, LLMValidationError
-from llm.models import ICSMessage, ICSRequest
+from llm.models import ICSMessage, ICSRequest, MessageEntry
 from llm.parser import YAMLRequestParser, register_preset_loader
 from llm.recorder import UsageRecorder as _BaseUsageRecorder
 
-from .client import AsyncLLMClient, LLMClient
 from .config import GeminiAPIConfig
 from .preset_loader import load_preset
 from .tavern_converter import batch_convert, convert_tavern_to_preset
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .client import AsyncLLMClient, LLMClient, reset_recorder
+
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
+# 客户端依赖 google-genai SDK（加载较重），首次访问时再导入，
+# 仅使用预设/转换器/配置等功能时不必加载 SDK
+_LAZY_ATTRS = {
+    "LLMClient": ".client",
+    "AsyncLLMClient": ".client",
+    "reset_recorder": ".client",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
 register_preset_loader(load_preset)
 
 
@@ -34,11 +59,13 @@ __all__ = [
     "RetryConfig",
     "load_env_file",
     "UsageRecorder",
+    "reset_recorder",
     "LLMConfigError",
     "LLMValidationError",
     "LLMTransportError",
     "ICSMessage",
     "ICSRequest",
+    "MessageEntry",
     "YAMLRequestParser",
     "load_preset",
     "convert_tavern_to_preset",
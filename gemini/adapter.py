@@ -2,7 +2,8 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
 from llm.exceptions import LLMConfigError, LLMValidationError
 from llm.models import ICSRequest
@@ -16,23 +17,56 @@ except ImportError as exc:  # pragma: no cover - import guard
 
 logger = logging.getLogger(__name__)
 
+# 直接透传到 generation_config 的生成参数
+_GEN_KEYS = ("max_output_tokens", "temperature", "top_p", "top_k")
+# ICS 角色到 Gemini 角色的映射；未列出的角色原样使用
+_ROLE_MAP = {"assistant": "model"}
+
+
+@dataclass(slots=True)
+class GeminiPayload:
+    """to_chat 的输出：发送请求所需的全部 Gemini SDK 参数。"""
+
+    model: str
+    history: List[genai_types.Content]
+    current_message: genai_types.Content
+    system_instruction: Optional[Any] = None
+    generation_config: Dict[str, Any] = field(default_factory=dict)
+    tools: Optional[List[genai_types.Tool]] = None
+    inline_citations: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """dry_run / include_debug 展示用的字典形式（省略空字段）。"""
+        data: Dict[str, Any] = {
+            "model": self.model,
+            "history": self.history,
+            "current_message": self.current_message,
+        }
+        if self.tools:
+            data["tools"] = self.tools
+        if self.inline_citations:
+            data["inline_citations"] = True
+        if self.system_instruction is not None:
+            data["system_instruction"] = self.system_instruction
+        if self.generation_config:
+            data["generation_config"] = self.generation_config
+        return data
+
 
 class GeminiAdapter:
     """Gemini 适配器：将 ICS 消息转换为 Gemini SDK 格式。"""
 
     @staticmethod
-    def to_chat(ics: ICSRequest, file_uploader: Optional[Any] = None) -> Dict[str, Any]:
+    def to_chat(ics: ICSRequest, file_uploader: Optional[Any] = None) -> GeminiPayload:
         """
         将 ICS 请求转换为 Gemini SDK 格式。
 
-        返回格式：
-        {
-            "model": "gemini-2.5-flash",
-            "system_instruction": "...",  # 可选
-            "history": [Content, ...],     # 历史消息（除最后一条）
-            "current_message": Content,    # 当前消息（最后一条，必须是 user）
-            "generation_config": {...}     # 生成配置
-        }
+        返回 GeminiPayload：
+            model: "gemini-2.5-flash"
+            system_instruction: "..."       # 无则为 None
+            history: [Content, ...]         # 历史消息（除最后一条）
+            current_message: Content        # 当前消息（最后一条，必须是 user）
+            generation_config: {...}        # 生成配置
         """
         gen = ics.generation
         model = gen.get("model")
@@ -84,7 +118,7 @@ class GeminiAdapter:
         # 2. 构建 generation_config
         generation_config = {
             key: gen[key]
-            for key in ("max_output_tokens", "temperature", "top_p", "top_k")
+            for key in _GEN_KEYS
             if key in gen
         }
 
@@ -123,21 +157,19 @@ class GeminiAdapter:
         if format_gen_config:
             generation_config.update(format_gen_config)
 
-        payload = {"model": model, "history": gemini_history, "current_message": current_message}
+        payload = GeminiPayload(
+            model=model,
+            history=gemini_history,
+            current_message=current_message,
+            system_instruction=system_instruction or None,
+            generation_config=generation_config,
+        )
 
         tools_config = gen.get("tools")
         if tools_config:
             payload_tools, inline_citations = GeminiAdapter._build_tools(tools_config)
-            if payload_tools:
-                payload["tools"] = payload_tools
-            if inline_citations:
-                payload["inline_citations"] = True
-
-        if system_instruction:
-            payload["system_instruction"] = system_instruction
-
-        if generation_config:
-            payload["generation_config"] = generation_config
+            payload.tools = payload_tools or None
+            payload.inline_citations = inline_citations
 
         return payload
 
@@ -154,34 +186,41 @@ class GeminiAdapter:
         if role == "system":
             raise LLMValidationError("system 消息只能作为 system_instruction 提供")
 
-        descriptors = GeminiAdapter._build_descriptors(content, file_uploader, log_upload=log_upload)
+        descriptors, last_text_idx = GeminiAdapter._build_descriptors(content, file_uploader, log_upload=log_upload)
         if apply_format_suffix:
-            GeminiAdapter._apply_format_suffix(descriptors, format_config)
+            GeminiAdapter._apply_format_suffix(descriptors, last_text_idx, format_config)
         parts = [GeminiAdapter._descriptor_to_part(descriptor) for descriptor in descriptors]
         return genai_types.Content(role=role, parts=parts)
 
     @staticmethod
     def _convert_history(messages: List[Any], file_uploader: Optional[Any] = None) -> List[genai_types.Content]:
-        history: List[genai_types.Content] = []
-        for msg in messages:
-            role = "model" if msg.role == "assistant" else msg.role
+        # 单轮请求没有历史消息
+        if not messages:
+            return []
+        history: List[genai_types.Content] = [None] * len(messages)  # type: ignore[list-item]
+        for idx, msg in enumerate(messages):
+            role = _ROLE_MAP.get(msg.role, msg.role)
             if role == "system":
                 raise LLMValidationError("system 消息只能出现在第一条，且已被提取为 system_instruction")
-            history.append(
-                GeminiAdapter._build_content(
-                    role=role,
-                    content=msg.content,
-                    file_uploader=file_uploader,
-                    log_upload=True,
-                    format_config=None,
-                )
+            history[idx] = GeminiAdapter._build_content(
+                role=role,
+                content=msg.content,
+                file_uploader=file_uploader,
+                log_upload=True,
+                format_config=None,
             )
         return history
 
     @staticmethod
-    def _build_descriptors(content: Any, file_uploader: Optional[Any], *, log_upload: bool) -> List[Dict[str, Any]]:
+    def _build_descriptors(
+        content: Any,
+        file_uploader: Optional[Any],
+        *,
+        log_upload: bool,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """返回 (descriptors, 最后一个文本片段的下标)，无文本片段时下标为 -1。"""
         if isinstance(content, str):
-            return [{"kind": "text", "text": content}]
+            return [{"kind": "text", "text": content}], 0
         if isinstance(content, list):
             return GeminiAdapter._build_descriptors_from_list(content, file_uploader, log_upload=log_upload)
         raise LLMValidationError("消息内容必须为字符串或列表")
@@ -192,15 +231,20 @@ class GeminiAdapter:
         file_uploader: Optional[Any],
         *,
         log_upload: bool,
-    ) -> List[Dict[str, Any]]:
-        descriptors: List[Dict[str, Any]] = []
-        for part in content_parts:
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        # 结果长度与输入一致，预分配后按下标写入；图片路径先收集，最后一次性并发上传再回填
+        descriptors: List[Dict[str, Any]] = [None] * len(content_parts)  # type: ignore[list-item]
+        image_slots: List[int] = []
+        image_paths: List[str] = []
+        last_text_idx = -1
+        for idx, part in enumerate(content_parts):
             part_type = part.get("type")
             if part_type == "text":
                 text = part.get("text")
                 if not isinstance(text, str):
                     raise LLMValidationError("text part 需要 text 字段")
-                descriptors.append({"kind": "text", "text": text})
+                descriptors[idx] = {"kind": "text", "text": text}
+                last_text_idx = idx
             elif part_type == "image":
                 image_path = part.get("path")
                 if not image_path:
@@ -209,23 +253,29 @@ class GeminiAdapter:
                     raise LLMValidationError("需要 file_uploader 来处理图片消息")
                 if log_upload:
                     logger.debug("上传图片: %s", image_path)
-                uploaded_file = file_uploader.upload_file(image_path)
-                descriptors.append({"kind": "file", "file": uploaded_file})
+                image_slots.append(idx)
+                image_paths.append(image_path)
             else:
                 raise LLMValidationError(f"未知的多模态类型: {part_type}")
-        return descriptors
+        if image_paths:
+            uploaded_files = file_uploader.upload_files(image_paths)
+            for slot, uploaded_file in zip(image_slots, uploaded_files):
+                descriptors[slot] = {"kind": "file", "file": uploaded_file}
+        return descriptors, last_text_idx
 
     @staticmethod
-    def _apply_format_suffix(parts: List[Dict[str, Any]], format_config: Optional[Dict[str, Any]]) -> None:
-        if not parts:
+    def _apply_format_suffix(
+        parts: List[Dict[str, Any]],
+        last_text_idx: int,
+        format_config: Optional[Dict[str, Any]],
+    ) -> None:
+        if last_text_idx < 0:
             return
         suffix = GeminiFormatHandler.get_prompt_suffix(format_config)
         if not suffix:
             return
-        for descriptor in reversed(parts):
-            if descriptor.get("kind") == "text":
-                descriptor["text"] = f"{descriptor['text']}{suffix}"
-                break
+        descriptor = parts[last_text_idx]
+        descriptor["text"] = f"{descriptor['text']}{suffix}"
 
     @staticmethod
     def _descriptor_to_part(descriptor: Dict[str, Any]) -> genai_types.Part:
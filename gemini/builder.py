@@ -2,8 +2,8 @@
 from __future__ import annotations
 import json
 import logging
-import uuid
-from typing import Any, Dict, List
+import secrets
+from typing import Any, Dict, List, Optional
 
 from llm.exceptions import LLMConfigError, LLMValidationError
 from llm.macros import render_macros
@@ -18,28 +18,38 @@ logger = logging.getLogger(__name__)
 
 class ICSBuilder:
     """ICS 构建器。"""
-    def __init__(self, config: GeminiAPIConfig):
+    def __init__(self, config: GeminiAPIConfig, file_uploader: Optional[Any] = None):
         self._config = config
+        # 可选：用于在构建阶段提前在后台计算图片摘要
+        self._file_uploader = file_uploader
 
-    def build(self, parsed: Dict[str, Any]) -> ICSRequest:
+    def build(self, parsed: Dict[str, Any], *, trace_id: Optional[str] = None) -> ICSRequest:
         msgs = parsed["messages"]
         base_msgs = self._build_message_chain(msgs)
 
-        gen = dict(parsed.get("generation", {}))
-        model = gen.get("model") or self._config.default_model
-        if not model:
-            raise LLMConfigError("未提供模型")
-        gen["model"] = model
-
-        routing = dict(parsed.get("routing", {}))
-        meta = dict(parsed.get("meta", {}))
-        meta.setdefault("trace_id", str(uuid.uuid4()))
+        # generation/routing/meta 直接引用 parsed 中的字典（ICSRequest 与其共享）；
+        # 仅在确实需要改写时才复制（写时复制），调用方传入的 parsed 始终不被修改
+        gen = parsed.get("generation") or {}
+        if not gen.get("model"):
+            model = self._config.default_model
+            if not model:
+                raise LLMConfigError("未提供模型")
+            gen = {**gen, "model": model}
+
+        routing = parsed.get("routing") or {}
+        meta = parsed.get("meta") or {}
+        # 调用方已生成 trace_id 时直接沿用，避免重复生成；客户端的 trace_id 通常正取自 meta，无需改写
+        current = meta.get("trace_id")
+        if trace_id:
+            if current != trace_id:
+                meta = {**meta, "trace_id": trace_id}
+        elif not current:
+            meta = {**meta, "trace_id": secrets.token_hex(16)}
 
         fmt = parsed.get("format")
 
-        messages = list(base_msgs)
-
-        return ICSRequest(messages=messages, generation=gen, routing=routing, meta=meta, format_config=fmt)
+        # base_msgs 由 _build_message_chain 新建，无需再复制
+        return ICSRequest(messages=base_msgs, generation=gen, routing=routing, meta=meta, format_config=fmt)
 
     def _build_message_chain(self, data: Any) -> List[ICSMessage]:
         if isinstance(data, list):
@@ -118,10 +128,23 @@ class ICSBuilder:
             if custom_systems:
                 system_dict["custom"] = custom_systems
 
-            # 转换为JSON字符串（不使用indent以保持紧凑）
+            # 转换为JSON字符串（不使用indent以保持紧凑）。
+            # 这里有意使用标准库而非 _json_dumps：orjson 的输出没有 ", "/": " 分隔空格，
+            # 是否安装 orjson 会改变 system_instruction 的字节内容，破坏提示前缀缓存
             merged_system = json.dumps(system_dict, ensure_ascii=False)
             messages.append(ICSMessage(role="system", content=merged_system))
 
+        # 尽早在后台计算图片摘要，与后续构建/转换重叠，adapter 上传时直接命中
+        if self._file_uploader is not None:
+            image_paths = [
+                path
+                for entry in other_entries
+                if entry.images
+                for path in entry.images.get("urls") or ()
+            ]
+            if image_paths:
+                self._file_uploader.prewarm(image_paths)
+
         # 添加其他消息（保持顺序）
         for entry in other_entries:
             # 如果有图片，构建多模态内容
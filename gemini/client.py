@@ -1,30 +1,126 @@
 """LLM 客户端。"""
 from __future__ import annotations
+import functools
+import io
+import itertools
 import logging
+import os
+import secrets
+import threading
 import time
-import uuid
-from typing import Any, Dict, List, Optional, Union
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Union
 
 from llm.config import RetryConfig
 from llm.exceptions import LLMConfigError, LLMTransportError, LLMValidationError
 from llm.parser import YAMLRequestParser
 from llm.recorder import UsageRecorder
-from llm.utils import _retry
+from llm.utils import _MISSING, RETRYABLE_STATUS_CODES, _retry, dumps_debug
 
-from .adapter import GeminiAdapter
+from .adapter import GeminiAdapter, GeminiPayload
 from .builder import ICSBuilder
 from .config import GeminiAPIConfig
-from .file_utils import GeminiFileUploader
+from .file_utils import DryRunFileUploader, GeminiFileUploader
 from .format import GeminiFormatHandler
 
 try:
     import google.genai as genai
+    import httpx
+    from google.genai import errors as genai_errors
     from google.genai import types as genai_types
 except ImportError as e:
     raise ImportError("需要 google-genai SDK: pip install google-genai") from e
 
 logger = logging.getLogger(__name__)
 
+# 热路径上频繁使用的 SDK 类型，模块加载时绑定一次
+_ThinkingConfig = genai_types.ThinkingConfig
+_ImageConfig = genai_types.ImageConfig
+_GenerateContentConfig = genai_types.GenerateContentConfig
+
+
+# (api_key, base_url) -> (genai.Client, GeminiFileUploader)；弱引用，所有 LLMClient 释放后自动回收
+_SDK_CLIENT_CACHE: "weakref.WeakValueDictionary[tuple, Any]" = weakref.WeakValueDictionary()
+_SDK_UPLOADER_CACHE: "weakref.WeakValueDictionary[tuple, GeminiFileUploader]" = weakref.WeakValueDictionary()
+_SDK_CACHE_LOCK = threading.Lock()
+
+# dry_run 时代替真实上传器：图片只生成占位引用，不读取文件、不调用 Files API
+_DRY_RUN_UPLOADER = DryRunFileUploader()
+
+# 多张生成图片并发上传到 OpenList 的最大线程数
+_OPENLIST_UPLOAD_WORKERS = 4
+# invoke_from_yaml_batch 默认的最大并发请求数
+_BATCH_MAX_WORKERS = 8
+
+# SDK 底层 httpx 连接池的保活参数：httpx 默认空闲 5 秒即断开，
+# 而相邻两次生成请求的间隔往往更长，延长保活以免每次请求都重新握手 TLS
+_KEEPALIVE_EXPIRY = 300.0
+_MAX_KEEPALIVE_CONNECTIONS = 20
+
+
+def _sdk_http_options() -> Any:
+    """构造带连接池参数的 HttpOptions；旧版 SDK 不支持 client_args 时返回 None（使用 SDK 默认值）。"""
+    http_options_cls = getattr(genai_types, "HttpOptions", None)
+    fields = getattr(http_options_cls, "model_fields", None) or {}
+    if "client_args" not in fields:
+        return None
+    limits = httpx.Limits(
+        max_keepalive_connections=_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=_KEEPALIVE_EXPIRY,
+    )
+    kwargs: Dict[str, Any] = {"client_args": {"limits": limits}}
+    if "async_client_args" in fields:
+        kwargs["async_client_args"] = {"limits": limits}
+    return http_options_cls(**kwargs)
+
+
+def _shared_sdk_client(config: GeminiAPIConfig) -> tuple[Any, GeminiFileUploader]:
+    """按 (api_key, base_url) 复用 genai.Client 及其文件上传器。"""
+    key = (config.api_key, getattr(config, "base_url", None))
+    with _SDK_CACHE_LOCK:
+        client = _SDK_CLIENT_CACHE.get(key)
+        if client is None:
+            http_options = _sdk_http_options()
+            if http_options is not None:
+                client = genai.Client(api_key=config.api_key, http_options=http_options)
+            else:
+                client = genai.Client(api_key=config.api_key)
+            _SDK_CLIENT_CACHE[key] = client
+        uploader = _SDK_UPLOADER_CACHE.get(key)
+        if uploader is None:
+            uploader = GeminiFileUploader(client, cache_cap=config.file_cache_cap)
+            _SDK_UPLOADER_CACHE[key] = uploader
+    return client, uploader
+
+
+@functools.lru_cache(maxsize=1)
+def _get_recorder() -> UsageRecorder:
+    """进程内共享的默认用量记录器；首次记录用量时才建库建表，导入与构造客户端均不触碰磁盘。"""
+    return UsageRecorder(
+        env_var="GEMINI_USAGE_DB",
+        default_filename="gemini_usage_log.db",
+        supports_thoughts=True,
+    )
+
+
+def reset_recorder() -> None:
+    """丢弃缓存的默认记录器（测试中切换 GEMINI_USAGE_DB 后使用），下次记录时重新创建。"""
+    recorder = _get_recorder() if _get_recorder.cache_info().currsize else None
+    _get_recorder.cache_clear()
+    if recorder is not None:
+        recorder.close()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """仅对网络错误、超时、限流与 5xx 重试；其余错误（如鉴权、参数错误）立即抛出。"""
+    cause = exc.__cause__ if isinstance(exc, LLMTransportError) else exc
+    if isinstance(cause, httpx.TransportError):
+        return True
+    if isinstance(cause, genai_errors.APIError):
+        return cause.code in RETRYABLE_STATUS_CODES
+    return False
+
 
 class _BaseLLMClient:
     """LLM 客户端基类（提取公共方法）。"""
@@ -35,17 +131,26 @@ class _BaseLLMClient:
 
     def __init__(self, config: GeminiAPIConfig, recorder: Optional[UsageRecorder], retry_config: Optional[RetryConfig]):
         self._config = config
-        self._builder = ICSBuilder(config)
-        self._recorder = recorder or UsageRecorder(
-            env_var="GEMINI_USAGE_DB",
-            default_filename="gemini_usage_log.db",
-            supports_thoughts=True,
-        )
+        # 未显式传入时延迟到 _record_usage 再取共享的默认记录器
+        self._recorder = recorder
         self._retry_config = retry_config or RetryConfig()
-        # 配置新版 SDK 客户端
-        self._genai_client = genai.Client(api_key=config.api_key)
-        # 初始化文件上传器（用于多模态功能）
-        self._file_uploader = GeminiFileUploader(self._genai_client)
+        # 配置新版 SDK 客户端与文件上传器（相同 api_key 的实例间共享连接与上传缓存）
+        self._genai_client, self._file_uploader = _shared_sdk_client(config)
+        self._builder = ICSBuilder(config, self._file_uploader)
+        # 生成图片上传用的 OpenList 客户端，首次上传时创建
+        self._openlist_client: Any = None
+        self._openlist_lock = threading.Lock()
+
+    @staticmethod
+    def dumps_debug(payload: Any) -> str:
+        """将 dry_run / include_debug 的返回值序列化为 JSON（安装 orjson 时走快速路径）。"""
+        return dumps_debug(payload)
+
+    @staticmethod
+    def _resolve_trace_id(parsed: Dict[str, Any]) -> str:
+        """沿用 YAML meta 中的 trace_id，否则生成一次；结果显式传给 builder，不修改 parsed。"""
+        meta = parsed.get("meta") or {}
+        return meta.get("trace_id") or secrets.token_hex(16)
 
     def _extract_result(
         self,
@@ -53,8 +158,12 @@ class _BaseLLMClient:
         format_config: Optional[Dict[str, Any]] = None,
         *,
         inline_citations: bool = False,
+        include_thoughts: bool = True,
     ) -> Any:
-        """从 Gemini 响应中提取并处理结果（支持文本和图片）。"""
+        """从 Gemini 响应中提取并处理结果（支持文本和图片）。
+
+        include_thoughts=False 时请求未开启思考输出，跳过逐 part 的 thought 判断。
+        """
         try:
             if not hasattr(resp, "candidates") or not resp.candidates:
                 raise LLMTransportError("响应中没有候选结果")
@@ -66,31 +175,36 @@ class _BaseLLMClient:
             parts = candidate.content.parts
 
             thoughts: List[str] = []
-            answer_parts_info: List[Dict[str, Any]] = []
+            answer_parts: List[str] = []
+            answer_indices: List[int] = []
             image_parts: List[Any] = []
 
+            # 单次遍历完成分类
             for idx, part in enumerate(parts):
-                inline_data = getattr(part, "inline_data", None)
-                if inline_data is not None:
+                if getattr(part, "inline_data", None) is not None:
                     image_parts.append(part)
                     continue
 
                 text_value = getattr(part, "text", None)
-                if getattr(part, "thought", False):
+                if include_thoughts and getattr(part, "thought", False):
                     if text_value:
                         thoughts.append(text_value)
                     continue
 
                 if text_value:
-                    answer_parts_info.append({"text": text_value, "part_index": idx})
+                    answer_parts.append(text_value)
+                    answer_indices.append(idx)
 
             fmt_type = None
             if format_config and isinstance(format_config, dict):
                 fmt_type = format_config.get("type")
-            if inline_citations and fmt_type not in ("json", "json_schema"):
+            # 仅在需要内嵌引用时才构建带 part 下标的片段信息
+            if inline_citations and fmt_type not in ("json", "json_schema") and answer_parts:
+                answer_parts_info = [
+                    {"text": text, "part_index": idx} for text, idx in zip(answer_parts, answer_indices)
+                ]
                 self._apply_grounding_citations_to_parts(answer_parts_info, candidate)
-
-            answer_parts = [item["text"] for item in answer_parts_info]
+                answer_parts = [item["text"] for item in answer_parts_info]
 
             if image_parts:
                 result = self._extract_image_result(image_parts, answer_parts, thoughts, format_config)
@@ -137,8 +251,9 @@ class _BaseLLMClient:
                 "data": getattr(inline_data, "data", None)
             })
 
-        # 处理图片：保存并上传
+        # 处理图片：先全部保存到本地，再统一上传
         image_results = []
+        saved_results = []
         for img in images:
             try:
                 # 生成时间戳文件名
@@ -148,19 +263,13 @@ class _BaseLLMClient:
                 local_path = self._save_generated_image(img["data"], timestamp)
                 logger.info("图片已保存到本地: %s", local_path)
 
-                # 根据配置决定是否上传到OpenList
-                online_url = None
-                if self._config.image_upload_enabled:
-                    online_url = self._upload_to_openlist(local_path)
-                    logger.info("图片已上传到OpenList: %s", online_url)
-                else:
-                    logger.info("图片上传已禁用，仅保存本地文件")
-
-                image_results.append({
+                result = {
                     "local_path": local_path,
-                    "online_url": online_url,
+                    "online_url": None,
                     "mime_type": img["mime_type"]
-                })
+                }
+                image_results.append(result)
+                saved_results.append(result)
             except Exception as e:
                 logger.error("图片处理失败: %s", e)
                 # 即使失败也继续处理其他图片
@@ -170,6 +279,22 @@ class _BaseLLMClient:
                     "error": str(e)
                 })
 
+        # 根据配置决定是否上传到OpenList；多张图片并发上传
+        if saved_results:
+            if self._config.image_upload_enabled:
+                local_paths = [r["local_path"] for r in saved_results]
+                if len(local_paths) > 1:
+                    workers = min(len(local_paths), _OPENLIST_UPLOAD_WORKERS)
+                    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openlist-upload") as pool:
+                        online_urls = list(pool.map(self._upload_to_openlist, local_paths))
+                else:
+                    online_urls = [self._upload_to_openlist(local_paths[0])]
+                for result, online_url in zip(saved_results, online_urls):
+                    result["online_url"] = online_url
+                    logger.info("图片已上传到OpenList: %s", online_url)
+            else:
+                logger.info("图片上传已禁用，仅保存本地文件")
+
         # 根据响应模式返回
         if texts and images:
             # both模式：同时返回文本和图片
@@ -345,10 +470,7 @@ class _BaseLLMClient:
     def _upload_to_openlist(self, local_path: str) -> str:
         """上传图片到OpenList，自动按年/月组织目录。"""
         try:
-            from openlist_api import OpenListClient
-
-            # 使用环境变量中的配置创建客户端
-            openlist_client = OpenListClient.from_env()
+            openlist_client = self._get_openlist_client()
 
             # 上传并获取分享链接（自动按年/月组织目录）
             online_url = openlist_client.upload_image(local_path)
@@ -358,22 +480,35 @@ class _BaseLLMClient:
             logger.warning("openlist_api 模块未安装，跳过上传")
             return f"(未上传: {local_path})"
         except Exception as e:
-            # 如果上传失败，返回本地路径
+            # 如果上传失败，返回本地路径；丢弃客户端，下次重新登录（token 可能已过期）
+            self._openlist_client = None
             logger.warning("OpenList上传失败: %s", e)
             return f"(上传失败: {local_path})"
 
+    def _get_openlist_client(self) -> Any:
+        """返回复用的 OpenList 客户端（首次使用时创建并登录，之后复用 token 与连接）。"""
+        client = self._openlist_client
+        if client is None:
+            from openlist_api import OpenListClient
+
+            with self._openlist_lock:
+                client = self._openlist_client
+                if client is None:
+                    # 使用环境变量中的配置创建客户端
+                    client = OpenListClient.from_env()
+                    client.login()
+                    self._openlist_client = client
+        return client
+
     def _record_usage(self, resp: Any, trace_id: Optional[str], model: str):
         """记录使用量。"""
         try:
-            # 尝试从不同位置获取 usage_metadata
-            usage_metadata = None
-
-            # 方式1: 直接从 resp 获取
-            if hasattr(resp, "usage_metadata"):
-                usage_metadata = resp.usage_metadata
-            # 方式2: 从 resp.result 获取
-            elif hasattr(resp, "result") and hasattr(resp.result, "usage_metadata"):
-                usage_metadata = resp.result.usage_metadata
+            # 每个属性只查找一次：getattr 带默认值代替 hasattr + 再次取属性
+            result = getattr(resp, "result", None)
+            # 优先直接从 resp 获取 usage_metadata，resp 上没有该属性时再从 resp.result 获取
+            usage_metadata = getattr(resp, "usage_metadata", _MISSING)
+            if usage_metadata is _MISSING:
+                usage_metadata = getattr(result, "usage_metadata", None)
 
             if usage_metadata:
                 # 获取 thoughts_token_count（如果有，Thinking mode）
@@ -387,9 +522,7 @@ class _BaseLLMClient:
                 }
 
                 # 获取 model_version（如果有）
-                model_version = None
-                if hasattr(resp, "result") and hasattr(resp.result, "model_version"):
-                    model_version = resp.result.model_version
+                model_version = getattr(result, "model_version", None)
 
                 # 使用 model_version 或传入的 model
                 actual_model = model_version or model
@@ -397,7 +530,7 @@ class _BaseLLMClient:
                 # 获取 request_id（如果有）
                 request_id = None
 
-                self._recorder.record(
+                (self._recorder or _get_recorder()).record(
                     model=actual_model,
                     request_id=request_id,
                     trace_id=trace_id,
@@ -405,6 +538,8 @@ class _BaseLLMClient:
                 )
 
                 # 日志输出（包含 thoughts_tokens 如果有）
+                if not logger.isEnabledFor(logging.INFO):
+                    return
                 if thoughts_tokens:
                     logger.info(
                         "记录使用量 trace_id=%s model=%s prompt=%s completion=%s total=%s thoughts=%s",
@@ -432,34 +567,53 @@ class LLMClient(_BaseLLMClient):
     """同步 LLM 客户端。"""
     def __init__(self, config: GeminiAPIConfig, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None):
         super().__init__(config, recorder, retry_config)
+        # 重试装饰只在构造时应用一次，且只包住网络调用
+        retry = _retry(self._retry_config, is_async=False, retry_on=_is_retryable)
+        self._generate = retry(self._generate_once)
+        self._open_stream = retry(self._open_stream_once)
 
     @classmethod
     def from_env(cls, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None):
         return cls(GeminiAPIConfig.from_env(), recorder, retry_config)
 
-    def invoke_from_yaml(self, yaml_prompt: str, *, dry_run: bool = False, include_debug: bool = False, raw_response: bool = False) -> Union[str, Dict[str, Any], Any]:
+    def invoke_from_yaml(
+        self,
+        yaml_prompt: Union[str, os.PathLike[str]],
+        *,
+        dry_run: bool = False,
+        include_debug: bool = False,
+        raw_response: bool = False,
+        stream: bool = False,
+    ) -> Union[str, Dict[str, Any], Iterator[str], Any]:
+        """执行 YAML 请求。
+
+        yaml_prompt 为 YAML 文本；传入 Path 等路径对象时直接从文件流式解析。
+        stream=True 时返回生成器，逐段产出答案文本（不含思考内容）；
+        生成器结束时的返回值（StopIteration.value）为经格式处理后的完整结果。
+        stream 不能与 raw_response / include_debug 同时使用；流式模式不返回生成的图片。
+        """
+        if stream and (raw_response or include_debug):
+            raise LLMValidationError("stream=True 不支持 raw_response 或 include_debug")
         start = time.time()
-        trace_id = str(uuid.uuid4())
-        logger.info("处理请求 trace_id=%s dry_run=%s", trace_id, dry_run)
 
         # 1. 解析 YAML
         parsed = YAMLRequestParser.parse(yaml_prompt)
-        ics = self._builder.build(parsed)
-        if "trace_id" not in ics.meta:
-            ics.meta["trace_id"] = trace_id
+        trace_id = self._resolve_trace_id(parsed)
+        logger.info("处理请求 trace_id=%s dry_run=%s", trace_id, dry_run)
+        ics = self._builder.build(parsed, trace_id=trace_id)
 
-        # 2. 转换为 Gemini 格式（传入 file_uploader 以支持多模态）
-        gemini_payload = GeminiAdapter.to_chat(ics, self._file_uploader)
-        inline_citations = bool(gemini_payload.pop("inline_citations", False))
+        # 2. 转换为 Gemini 格式（传入 file_uploader 以支持多模态；dry_run 不上传图片）
+        gemini_payload = GeminiAdapter.to_chat(ics, _DRY_RUN_UPLOADER if dry_run else self._file_uploader)
+        inline_citations = gemini_payload.inline_citations
 
         if dry_run:
-            payload_preview = dict(gemini_payload)
-            if inline_citations:
-                payload_preview["inline_citations"] = True
-            return {"ics_request": ics.to_payload(), "gemini_payload": payload_preview}
+            return {"ics_request": ics.to_payload(), "gemini_payload": gemini_payload.to_dict()}
+
+        if stream:
+            return self._stream_with_new_sdk(gemini_payload, trace_id, ics.format_config, start)
 
         # 3. 调用 Gemini SDK
-        resp = self._send(gemini_payload, ics.meta.get("trace_id"))
+        resp = self._send(gemini_payload, trace_id)
         logger.info("完成 trace_id=%s 耗时=%.2fs", trace_id, time.time() - start)
 
         # 4. 返回原始响应（如果请求）
@@ -467,98 +621,211 @@ class LLMClient(_BaseLLMClient):
             return resp
 
         # 5. 提取并处理结果
-        result = self._extract_result(resp, ics.format_config, inline_citations=inline_citations)
+        thinking_cfg = gemini_payload.generation_config.get("thinking_config") or {}
+        result = self._extract_result(
+            resp,
+            ics.format_config,
+            inline_citations=inline_citations,
+            include_thoughts=bool(thinking_cfg.get("include_thoughts", False)),
+        )
         if not include_debug:
             return result
         return {
             "result": result,
             "ics_request": ics.to_payload(),
-            "gemini_payload": {**gemini_payload, **({"inline_citations": True} if inline_citations else {})},
+            "gemini_payload": gemini_payload.to_dict(),
         }
 
-    def _send(self, payload: Dict[str, Any], trace_id: Optional[str]):
+    def invoke_from_yaml_batch(
+        self,
+        yaml_prompts: List[Union[str, os.PathLike[str]]],
+        *,
+        max_workers: int = _BATCH_MAX_WORKERS,
+        return_exceptions: bool = False,
+        dry_run: bool = False,
+        include_debug: bool = False,
+        raw_response: bool = False,
+    ) -> List[Any]:
+        """并发执行多个互不相关的 YAML 请求，结果顺序与输入一致。
+
+        共享同一个 SDK 连接池，总耗时接近最慢的一个请求而不是逐个累加。
+        return_exceptions=True 时失败请求的位置放入异常对象，否则抛出第一个失败。
+        """
+        if not yaml_prompts:
+            return []
+
+        def _run(yaml_prompt: Union[str, os.PathLike[str]]) -> Any:
+            try:
+                return self.invoke_from_yaml(
+                    yaml_prompt, dry_run=dry_run, include_debug=include_debug, raw_response=raw_response
+                )
+            except Exception as exc:  # noqa: BLE001
+                if return_exceptions:
+                    return exc
+                raise
+
+        if len(yaml_prompts) == 1:
+            return [_run(yaml_prompts[0])]
+        workers = max(1, min(max_workers, len(yaml_prompts)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gemini-batch") as pool:
+            return list(pool.map(_run, yaml_prompts))
+
+    def _send(self, payload: GeminiPayload, trace_id: Optional[str]):
         """发送请求到 Gemini API。"""
         return self._send_with_new_sdk(payload, trace_id)
 
-    def _send_with_new_sdk(self, payload: Dict[str, Any], trace_id: Optional[str]):
+    def _send_with_new_sdk(self, payload: GeminiPayload, trace_id: Optional[str]):
         """使用新 SDK 发送请求（支持 thinking）。"""
-        @_retry(self._retry_config, is_async=False)
-        def _call():
-            try:
-                model_name = payload["model"]
-                system_instruction = payload.get("system_instruction")
-                generation_config = payload.get("generation_config", {})
-                history = payload.get("history", [])
-                current_message = payload["current_message"]
-
-                # 构建 GenerateContentConfig
-                config_kwargs = {}
-                tools = payload.get("tools")
-
-                # 处理 thinking_config
-                if "thinking_config" in generation_config:
-                    thinking_cfg = generation_config["thinking_config"]
-                    thinking_budget = thinking_cfg.get("thinking_budget")
-                    include_thoughts = thinking_cfg.get("include_thoughts", False)
-
-                    config_kwargs["thinking_config"] = genai_types.ThinkingConfig(
-                        thinking_budget=thinking_budget,
-                        include_thoughts=include_thoughts
-                    )
-
-                # 处理其他 generation_config 参数
-                for key in ["temperature", "top_p", "top_k", "max_output_tokens"]:
-                    if key in generation_config:
-                        config_kwargs[key] = generation_config[key]
-
-                # 处理 response_mime_type 和 response_schema (format 相关)
-                if "response_mime_type" in generation_config:
-                    config_kwargs["response_mime_type"] = generation_config["response_mime_type"]
-                if "response_schema" in generation_config:
-                    config_kwargs["response_schema"] = generation_config["response_schema"]
-
-                # 处理图片生成配置
-                if "response_modalities" in generation_config:
-                    config_kwargs["response_modalities"] = generation_config["response_modalities"]
-
-                if "image_config" in generation_config:
-                    img_cfg = generation_config["image_config"]
-                    config_kwargs["image_config"] = genai_types.ImageConfig(
-                        aspect_ratio=img_cfg["aspect_ratio"]
-                    )
-
-                if tools:
-                    config_kwargs["tools"] = tools
-
-                # 构建完整的消息列表（system_instruction + history + current）
-                contents = list(history)
+        # 请求配置与 contents 只构建一次，重试只覆盖网络调用
+        model_name, contents, gen_config = self._prepare_request(payload)
+        resp = self._generate(model_name, contents, gen_config, trace_id)
+        self._record_usage(resp, trace_id, payload.model)
+        return resp
 
-                # 如果有 system_instruction，添加到配置中
-                if system_instruction:
-                    config_kwargs["system_instruction"] = system_instruction
+    def _stream_with_new_sdk(
+        self,
+        payload: GeminiPayload,
+        trace_id: Optional[str],
+        format_config: Optional[Dict[str, Any]],
+        start: float,
+    ) -> Iterator[str]:
+        """流式发送请求，边接收边产出答案文本；格式处理在流结束时执行一次，结果作为生成器返回值。"""
+        model_name, contents, gen_config = self._prepare_request(payload)
+
+        answer = io.StringIO()
+        thought_count = 0
+        last_chunk = None
+        try:
+            # 只重试建立流并取得首个分片的阶段；流开始后再重试会导致已产出的文本重复
+            for chunk in self._open_stream(model_name, contents, gen_config, trace_id):
+                last_chunk = chunk
+                candidates = getattr(chunk, "candidates", None)
+                if not candidates:
+                    continue
+                content = getattr(candidates[0], "content", None)
+                for part in getattr(content, "parts", None) or ():
+                    text_value = getattr(part, "text", None)
+                    if not text_value:
+                        continue
+                    if getattr(part, "thought", False):
+                        thought_count += len(text_value)
+                        continue
+                    answer.write(text_value)
+                    yield text_value
+        except LLMTransportError:
+            raise
+        except Exception as e:
+            error_msg = f"{e.__class__.__name__}: {str(e)}"
+            logger.error("流式响应中断 trace_id=%s: %s", trace_id, error_msg)
+            raise LLMTransportError(error_msg) from e
 
-                # 使用 Content 对象列表（history + 当前消息）
-                contents.append(current_message)
+        logger.info("完成 trace_id=%s 耗时=%.2fs", trace_id, time.time() - start)
+        if thought_count:
+            logger.info("流式模式不输出思考内容（%d 字符）", thought_count)
+        # 最后一个分片携带完整的 usage_metadata
+        if last_chunk is not None:
+            self._record_usage(last_chunk, trace_id, payload.model)
+        return GeminiFormatHandler.process_response(answer.getvalue(), format_config)
+
+    def _generate_once(self, model_name: str, contents: List[Any], gen_config: Any, trace_id: Optional[str]):
+        """单次 generate_content 调用（由 __init__ 中包装的 self._generate 负责重试）。"""
+        try:
+            return self._genai_client.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=gen_config,
+            )
+        except Exception as e:
+            error_msg = f"{e.__class__.__name__}: {str(e)}"
+            logger.error("API 错误 trace_id=%s: %s", trace_id, error_msg)
+            raise LLMTransportError(error_msg) from e
 
-                # 调用新 SDK
-                gen_config = genai_types.GenerateContentConfig(**config_kwargs) if config_kwargs else None
+    def _open_stream_once(self, model_name: str, contents: List[Any], gen_config: Any, trace_id: Optional[str]):
+        """单次 generate_content_stream 调用（由 self._open_stream 负责重试）。
 
-                response = self._genai_client.models.generate_content(
+        SDK 返回的是惰性生成器，连接/限流错误在首次迭代时才抛出，
+        因此在这里取出首个分片，使这些错误落在重试范围内。
+        """
+        try:
+            chunks = iter(
+                self._genai_client.models.generate_content_stream(
                     model=model_name,
                     contents=contents,
                     config=gen_config,
                 )
+            )
+            first = next(chunks, _MISSING)
+        except Exception as e:
+            error_msg = f"{e.__class__.__name__}: {str(e)}"
+            logger.error("API 错误 trace_id=%s: %s", trace_id, error_msg)
+            raise LLMTransportError(error_msg) from e
+        if first is _MISSING:
+            return iter(())
+        return itertools.chain((first,), chunks)
 
-                return response
+    @staticmethod
+    def _prepare_request(payload: GeminiPayload):
+        """由 Gemini payload 构建 (model, contents, GenerateContentConfig)。"""
+        model_name = payload.model
+        system_instruction = payload.system_instruction
+        generation_config = payload.generation_config
+        history = payload.history
+        current_message = payload.current_message
+
+        # 构建 GenerateContentConfig
+        config_kwargs = {}
+        tools = payload.tools
+
+        # 处理 thinking_config
+        if "thinking_config" in generation_config:
+            thinking_cfg = generation_config["thinking_config"]
+            thinking_budget = thinking_cfg.get("thinking_budget")
+            include_thoughts = thinking_cfg.get("include_thoughts", False)
+
+            config_kwargs["thinking_config"] = _ThinkingConfig(
+                thinking_budget=thinking_budget,
+                include_thoughts=include_thoughts
+            )
 
-            except Exception as e:
-                error_msg = f"{e.__class__.__name__}: {str(e)}"
-                logger.error("API 错误 trace_id=%s: %s", trace_id, error_msg)
-                raise LLMTransportError(error_msg) from e
+        # 处理其他 generation_config 参数
+        for key in ["temperature", "top_p", "top_k", "max_output_tokens"]:
+            if key in generation_config:
+                config_kwargs[key] = generation_config[key]
+
+        # 处理 response_mime_type 和 response_schema (format 相关)
+        if "response_mime_type" in generation_config:
+            config_kwargs["response_mime_type"] = generation_config["response_mime_type"]
+        if "response_schema" in generation_config:
+            config_kwargs["response_schema"] = generation_config["response_schema"]
+
+        # 处理图片生成配置
+        if "response_modalities" in generation_config:
+            config_kwargs["response_modalities"] = generation_config["response_modalities"]
+
+        if "image_config" in generation_config:
+            img_cfg = generation_config["image_config"]
+            config_kwargs["image_config"] = _ImageConfig(
+                aspect_ratio=img_cfg["aspect_ratio"]
+            )
 
-        resp = _call()
-        self._record_usage(resp, trace_id, payload["model"])
-        return resp
+        if tools:
+            config_kwargs["tools"] = tools
+
+        # 构建完整的消息列表（system_instruction + history + current）
+        contents = list(history)
+
+        # 如果有 system_instruction，添加到配置中
+        if system_instruction is not None:
+            config_kwargs["system_instruction"] = system_instruction
+
+        # 使用 Content 对象列表（history + 当前消息）
+        contents.append(current_message)
+
+        try:
+            gen_config = _GenerateContentConfig(**config_kwargs) if config_kwargs else None
+        except Exception as e:  # noqa: BLE001
+            raise LLMValidationError(f"generation_config 无效: {e}") from e
+        return model_name, contents, gen_config
 
 
 class AsyncLLMClient(_BaseLLMClient):
@@ -570,5 +837,5 @@ class AsyncLLMClient(_BaseLLMClient):
     def from_env(cls, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None):
         return cls(GeminiAPIConfig.from_env(), recorder, retry_config)
 
-    async def invoke_from_yaml(self, yaml_prompt: str, *, dry_run: bool = False, include_debug: bool = False) -> Union[str, Dict[str, Any]]:
+    async def invoke_from_yaml(self, yaml_prompt: Union[str, os.PathLike[str]], *, dry_run: bool = False, include_debug: bool = False) -> Union[str, Dict[str, Any]]:
         raise NotImplementedError("异步客户端暂不支持，请使用同步客户端 LLMClient")
@@ -15,23 +15,34 @@ class GeminiAPIConfig:
     api_key: str
     default_model: Optional[str]
     image_upload_enabled: bool = True  # 是否上传图片到OpenList
+    file_cache_cap: int = 1024  # Files API 上传缓存的最大条目数
 
     @classmethod
     def from_env(cls) -> "GeminiAPIConfig":
+        # 绑定一次 os.environ，每个键只查找、strip 一次
+        env = os.environ
+
         def require(key: str) -> str:
-            value = os.environ.get(key)
-            if not value or not value.strip():
+            value = env.get(key)
+            if not value or not (value := value.strip()):
                 raise LLMConfigError(f"缺少环境变量: {key}")
-            return value.strip()
+            return value
 
         # 读取上传开关配置（默认为true）
-        upload_enabled_str = os.environ.get("GEMINI_IMAGE_UPLOAD_ENABLED", "true").lower()
+        upload_enabled_str = env.get("GEMINI_IMAGE_UPLOAD_ENABLED", "true").lower()
         upload_enabled = upload_enabled_str in ("true", "1", "yes", "on")
 
+        cache_cap_str = env.get("GEMINI_FILE_CACHE_CAP", "1024").strip()
+        try:
+            file_cache_cap = int(cache_cap_str)
+        except ValueError as exc:
+            raise LLMConfigError(f"GEMINI_FILE_CACHE_CAP 必须为整数: {cache_cap_str}") from exc
+
         return cls(
             api_key=require("GEMINI_API_KEY"),
-            default_model=os.environ.get("GEMINI_MODEL"),
+            default_model=env.get("GEMINI_MODEL"),
             image_upload_enabled=upload_enabled,
+            file_cache_cap=file_cache_cap,
         )
 
 
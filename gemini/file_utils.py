@@ -1,49 +1,74 @@
 """Gemini Files API utilities."""
 from __future__ import annotations
 
+import hashlib
 import logging
 import mimetypes
+import mmap
+import os
+import stat
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from types import SimpleNamespace
-from typing import Any
+from typing import Any, Iterable, Optional
+
+try:
+    import blake3
+except ImportError:  # pragma: no cover - optional dependency
+    blake3 = None
 
 logger = logging.getLogger(__name__)
 
+# 不小于该大小的文件通过 mmap 计算摘要
+_MMAP_MIN_SIZE = 64 * 1024
+
 
 class GeminiFileUploader:
-    """Gemini Files API uploader with simple local cache."""
+    """Gemini Files API uploader with a bounded local LRU cache."""
 
-    def __init__(self, genai_client: Any):
+    def __init__(self, genai_client: Any, max_workers: int = 8, cache_cap: int = 1024):
         self._client = genai_client
-        self._uploaded_files: dict[str, Any] = {}
+        self._max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._cache_cap = max(1, cache_cap)
+        # 本地文件以内容摘要为键，远程 URI 以 URI 本身为键；LRU 有界，避免长期运行时无限增长
+        self._uploaded_files: OrderedDict[str, Any] = OrderedDict()
+        # (st_dev, st_ino, st_mtime_ns) -> 内容摘要，同一文件重复上传时跳过哈希计算
+        self._inode_cache: OrderedDict[tuple[int, int, int], str] = OrderedDict()
 
     def upload_file(self, file_path: str) -> Any:
         """Upload a file to Gemini Files API and cache the handle."""
         if self._is_remote_uri(file_path):
-            cached = self._uploaded_files.get(file_path)
+            cached = self._cache_get(self._uploaded_files, file_path)
             if cached is not None:
                 logger.debug("使用缓存的远程文件对象: %s", file_path)
                 return cached
 
             mime_type, _ = mimetypes.guess_type(file_path)
             handle = SimpleNamespace(uri=file_path, mime_type=mime_type or "application/octet-stream")
-            self._uploaded_files[file_path] = handle
+            handle = self._cache_put(self._uploaded_files, file_path, handle)
             logger.debug("使用远程文件URI: %s (%s)", handle.uri, handle.mime_type)
             return handle
 
         path = Path(file_path)
-        normalized_path = str(path.resolve())
+        # 一次 stat 同时完成存在性/类型检查，并交给 _digest_for 复用
+        try:
+            st = path.stat()
+        except OSError:
+            raise FileNotFoundError(f"文件不存在: {file_path}") from None
+        if not stat.S_ISREG(st.st_mode):
+            raise ValueError(f"路径不是文件: {file_path}")
+
+        digest = self._digest_for(path, st)
 
-        cached = self._uploaded_files.get(normalized_path)
+        cached = self._cache_get(self._uploaded_files, digest)
         if cached is not None:
             logger.debug("使用缓存的文件对象: %s", file_path)
             return cached
 
-        if not path.exists():
-            raise FileNotFoundError(f"文件不存在: {file_path}")
-        if not path.is_file():
-            raise ValueError(f"路径不是文件: {file_path}")
-
         logger.debug("上传文件到 Files API: %s", file_path)
         try:
             uploaded_file = self._client.files.upload(file=str(path))
@@ -52,12 +77,76 @@ class GeminiFileUploader:
             raise
 
         logger.debug("文件上传成功: %s -> %s (URI: %s)", path.name, uploaded_file.name, uploaded_file.uri)
-        self._uploaded_files[normalized_path] = uploaded_file
-        return uploaded_file
+        # 并发上传同一内容时以先写入者为准，保证返回同一个文件对象
+        return self._cache_put(self._uploaded_files, digest, uploaded_file)
 
     def upload_files(self, file_paths: list[str]) -> list[Any]:
-        """Upload multiple files and return the results."""
-        return [self.upload_file(file_path) for file_path in file_paths]
+        """Upload multiple files concurrently and return the results in order."""
+        if len(file_paths) <= 1:
+            return [self.upload_file(file_path) for file_path in file_paths]
+        return list(self._get_pool().map(self.upload_file, file_paths))
+
+    def prewarm(self, file_paths: Iterable[str]) -> None:
+        """Hash local files in the background so later uploads can skip hashing.
+
+        Returns immediately; failures are ignored here and surface again on upload.
+        """
+        local_paths = [p for p in file_paths if not self._is_remote_uri(p)]
+        if not local_paths:
+            return
+        pool = self._get_pool()
+        for file_path in local_paths:
+            pool.submit(self._prewarm_one, file_path)
+
+    def _prewarm_one(self, file_path: str) -> None:
+        try:
+            path = Path(file_path)
+            st = path.stat()
+            if stat.S_ISREG(st.st_mode):
+                self._digest_for(path, st)
+        except OSError as exc:
+            logger.debug("预计算文件摘要失败 %s: %s", file_path, exc)
+
+    def _digest_for(self, path: Path, st: Optional[os.stat_result] = None) -> str:
+        if st is None:
+            st = path.stat()
+        inode_key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        digest = self._cache_get(self._inode_cache, inode_key)
+        if digest is None:
+            digest = self._cache_put(self._inode_cache, inode_key, self._content_digest(path, st.st_size))
+        return digest
+
+    def close(self) -> None:
+        """Shut down the upload thread pool if it was started."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _cache_get(self, cache: OrderedDict, key: Any) -> Any:
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _cache_put(self, cache: OrderedDict, key: Any, value: Any) -> Any:
+        """Insert unless already present; return the cached value and evict LRU entries over the cap."""
+        with self._lock:
+            existing = cache.get(key)
+            if existing is not None:
+                cache.move_to_end(key)
+                return existing
+            cache[key] = value
+            while len(cache) > self._cache_cap:
+                cache.popitem(last=False)
+            return value
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="gemini-upload")
+            return self._pool
 
     @staticmethod
     def is_local_file(path: str) -> bool:
@@ -66,9 +155,42 @@ class GeminiFileUploader:
             return False
         return Path(path).exists()
 
+    @staticmethod
+    def _content_digest(path: Path, size: int) -> str:
+        """Return a digest of the file bytes combined with its size.
+
+        Uses BLAKE3 (SIMD) when installed, BLAKE2b-128 otherwise; digests are only
+        in-process cache keys, so the choice of hash never leaks outside.
+        """
+        h = blake3.blake3() if blake3 is not None else hashlib.blake2b(digest_size=16)
+        with path.open("rb") as f:
+            if size >= _MMAP_MIN_SIZE:
+                # 大文件映射后整体交给 hashlib：不产生分块 bytes 拷贝，且哈希期间释放 GIL
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    h.update(mm)
+            else:
+                h.update(f.read())
+        return f"{h.hexdigest()}:{size}"
+
     @staticmethod
     def _is_remote_uri(path: str) -> bool:
         return path.startswith(("http://", "https://"))
 
 
-__all__ = ["GeminiFileUploader"]
+class DryRunFileUploader:
+    """Stand-in uploader for dry runs: no file I/O and no Files API calls.
+
+    Each image becomes a placeholder handle whose ``uri`` is the original path,
+    so the payload shows what would be sent without uploading anything.
+    """
+
+    @staticmethod
+    def upload_file(file_path: str) -> Any:
+        mime_type, _ = mimetypes.guess_type(file_path)
+        return SimpleNamespace(uri=file_path, mime_type=mime_type or "application/octet-stream")
+
+    def upload_files(self, file_paths: list[str]) -> list[Any]:
+        return [self.upload_file(file_path) for file_path in file_paths]
+
+
+__all__ = ["GeminiFileUploader", "DryRunFileUploader"]
@@ -2,20 +2,33 @@
 from __future__ import annotations
 
 import json
+import threading
+from collections import OrderedDict
 from functools import lru_cache
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 from llm.exceptions import LLMValidationError
+from llm.utils import _json_dumps, _json_loads
 
 try:
     from google.genai import types as genai_types
 except ImportError as exc:  # pragma: no cover - import guard
     raise ImportError("需要 google-genai SDK: pip install google-genai") from exc
 
+# 固定格式的提示后缀，模块加载时构建一次
+_PROMPT_SUFFIXES: Dict[str, str] = {
+    "markdown": "\n\n请确保回应使用 Markdown 的标题或列表组织内容，避免纯文本。",
+}
+
 
 class GeminiFormatHandler:
     """Handle Gemini response formatting and schema validation."""
 
+    _SCHEMA_CACHE_MAX = 128
+    # id(schema) -> (schema, Schema 对象)；持有 schema 的强引用，保证 id 在条目存活期间不被复用
+    _SCHEMA_ID_CACHE: "OrderedDict[int, Tuple[Any, genai_types.Schema]]" = OrderedDict()
+    _CACHE_LOCK = threading.Lock()
+
     @staticmethod
     def get_generation_config(cfg: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         if not cfg:
@@ -42,12 +55,7 @@ class GeminiFormatHandler:
     def get_prompt_suffix(cfg: Optional[Dict[str, Any]]) -> Optional[str]:
         if not cfg:
             return None
-        fmt_type = cfg.get("type")
-        if fmt_type == "markdown":
-            return "\n\n请确保回应使用 Markdown 的标题或列表组织内容，避免纯文本。"
-        if fmt_type == "text":
-            return None
-        return None
+        return _PROMPT_SUFFIXES.get(cfg.get("type"))
 
     @staticmethod
     def merge_prompt_to_message(message: str, cfg: Optional[Dict[str, Any]]) -> str:
@@ -71,7 +79,7 @@ class GeminiFormatHandler:
             data = value
         elif isinstance(value, str):
             try:
-                data = json.loads(value)
+                data = _json_loads(value)
             except json.JSONDecodeError as exc:
                 raise LLMValidationError(f"返回内容不是合法 JSON: {exc}") from exc
         else:
@@ -101,19 +109,32 @@ class GeminiFormatHandler:
     def _normalize_schema(schema: Any) -> genai_types.Schema:
         if isinstance(schema, genai_types.Schema):
             return schema
+        id_cache = GeminiFormatHandler._SCHEMA_ID_CACHE
+        # 同一 schema 对象被复用时，跳过 JSON 规范化
+        with GeminiFormatHandler._CACHE_LOCK:
+            hit = id_cache.get(id(schema))
+            if hit is not None and hit[0] is schema:
+                id_cache.move_to_end(id(schema))
+                return hit[1]
         if isinstance(schema, genai_types.JSONSchema):
             payload = schema.to_json_dict()
         elif isinstance(schema, dict):
             payload = schema
         else:
             raise TypeError(f"不支持的 schema 类型: {type(schema)}")
-        schema_key = json.dumps(payload, sort_keys=True)
-        return GeminiFormatHandler._schema_from_json_text(schema_key)
+        schema_key = _json_dumps(payload, sort_keys=True)
+        schema_obj = GeminiFormatHandler._schema_from_json_text(schema_key)
+        with GeminiFormatHandler._CACHE_LOCK:
+            id_cache[id(schema)] = (schema, schema_obj)
+            id_cache.move_to_end(id(schema))
+            while len(id_cache) > GeminiFormatHandler._SCHEMA_CACHE_MAX:
+                id_cache.popitem(last=False)
+        return schema_obj
 
     @staticmethod
     @lru_cache(maxsize=32)
     def _schema_from_json_text(schema_text: str) -> genai_types.Schema:
-        json_schema_obj = genai_types.JSONSchema(**json.loads(schema_text))
+        json_schema_obj = genai_types.JSONSchema(**_json_loads(schema_text))
         return genai_types.Schema.from_json_schema(
             json_schema=json_schema_obj,
             api_option="GEMINI_API",
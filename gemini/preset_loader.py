@@ -7,10 +7,11 @@ import os
 import threading
 from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from llm.exceptions import LLMValidationError
 from llm.models import MessageEntry
+from llm.parser import _ROLE_CANON, _YAMLLoader
 
 try:
     import yaml
@@ -21,6 +22,11 @@ logger = logging.getLogger(__name__)
 
 _loading_state = threading.local()
 
+_UNPARSED = object()
+# 预设/预设组文件缓存：path -> [mtime_ns, size, 原始文本, 解析结果, system 拼接结果, 展开后的消息元组]，文件变更后自动失效
+_FILE_CACHE: Dict[Path, List[Any]] = {}
+_FILE_CACHE_LOCK = threading.Lock()
+
 _DEFAULT_PRESET_MODULE_ROOT = Path(__file__).resolve().parents[1] / "llm" / "preset_module"
 _DEFAULT_PRESET_DIR = _DEFAULT_PRESET_MODULE_ROOT / "preset"
 _DEFAULT_GROUP_DIR = _DEFAULT_PRESET_MODULE_ROOT / "groups"
@@ -45,8 +51,13 @@ def _resolve_custom_root() -> Optional[Path]:
     return candidate
 
 
-def _iter_search_dirs(subdir: str) -> List[Path]:
-    """Build ordered search paths, prioritising user-defined directories."""
+@lru_cache(maxsize=None)
+def _iter_search_dirs(subdir: str) -> Tuple[Path, ...]:
+    """Build ordered search paths, prioritising user-defined directories.
+
+    The result only depends on ``LLM_PRESET_ROOT`` (already resolved once), so it
+    is computed once per subdir instead of rebuilding Path objects per lookup.
+    """
     dirs: List[Path] = []
     custom_root = _resolve_custom_root()
     if custom_root:
@@ -55,7 +66,7 @@ def _iter_search_dirs(subdir: str) -> List[Path]:
         dirs.append(_DEFAULT_PRESET_DIR)
     else:
         dirs.append(_DEFAULT_GROUP_DIR)
-    return dirs
+    return tuple(dirs)
 
 
 @contextlib.contextmanager
@@ -105,6 +116,22 @@ def _find_preset_file(preset_name: str, preset_dirs: Iterable[Path]) -> Path:
     raise LLMValidationError(f"预设 '{preset_name}' 不存在。{hint}")
 
 
+def _iter_yaml_ids(directory: str | Path, prefix: str = "") -> Iterator[str]:
+    """Yield ``/``-separated ids of ``*.yaml`` files under ``directory`` using os.scandir."""
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return
+    with entries:
+        for entry in entries:
+            name = entry.name
+            # 与 rglob 一致：不跟随目录符号链接
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_yaml_ids(entry.path, f"{prefix}{name}/")
+            elif name.endswith(".yaml") and entry.is_file():
+                yield prefix + name[:-5]
+
+
 def _collect_available_keys(preset_dirs: Iterable[Path]) -> List[str]:
     """Collect available preset/group identifiers without duplicates."""
     collected: List[str] = []
@@ -112,9 +139,7 @@ def _collect_available_keys(preset_dirs: Iterable[Path]) -> List[str]:
     for directory in preset_dirs:
         if not directory.exists():
             continue
-        for yaml_file in directory.rglob("*.yaml"):
-            rel_path = yaml_file.relative_to(directory)
-            preset_id = str(rel_path.with_suffix("")).replace("\\", "/")
+        for preset_id in _iter_yaml_ids(directory):
             if preset_id in seen:
                 continue
             collected.append(preset_id)
@@ -123,13 +148,60 @@ def _collect_available_keys(preset_dirs: Iterable[Path]) -> List[str]:
     return collected
 
 
+def _cache_entry(path: Path) -> List[Any]:
+    """Return the cache slot for ``path``, re-reading the file when mtime/size changed."""
+    st = path.stat()
+    with _FILE_CACHE_LOCK:
+        entry = _FILE_CACHE.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry
+    text = path.read_text(encoding="utf-8")
+    entry = [st.st_mtime_ns, st.st_size, text, _UNPARSED, _UNPARSED, _UNPARSED]
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE[path] = entry
+    return entry
+
+
+def _read_text(path: Path) -> str:
+    return _cache_entry(path)[2]
+
+
+def _read_yaml(path: Path) -> Any:
+    """Parse a YAML file once per (mtime, size); callers must not mutate the result."""
+    entry = _cache_entry(path)
+    data = entry[3]
+    if data is _UNPARSED:
+        data = yaml.load(entry[2], Loader=_YAMLLoader)
+        entry[3] = data
+    return data
+
+
+def clear_preset_cache() -> None:
+    """Drop all cached preset/group file contents and search paths (mainly for tests)."""
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE.clear()
+    _resolve_custom_root.cache_clear()
+    _iter_search_dirs.cache_clear()
+
+
+def _copy_entries(entries: Iterable[MessageEntry]) -> List[MessageEntry]:
+    """缓存中的消息只读，返回给调用方的是浅拷贝，避免调用方修改污染缓存。"""
+    return [MessageEntry(role=e.role, content=e.content, images=e.images, source=e.source) for e in entries]
+
+
 def load_preset(preset_name: str) -> List[MessageEntry]:
     with _loading_guard(preset_name):
         preset_file = _find_preset_file(preset_name, _iter_search_dirs("preset"))
 
         try:
-            with preset_file.open("r", encoding="utf-8") as stream:
-                data = yaml.safe_load(stream)
+            cached = _cache_entry(preset_file)
+        except OSError:
+            cached = None
+        if cached is not None and cached[5] is not _UNPARSED:
+            return _copy_entries(cached[5])
+
+        try:
+            data = _read_yaml(preset_file)
         except yaml.YAMLError as exc:
             raise LLMValidationError(f"预设 '{preset_name}' YAML解析失败: {exc}") from exc
         except Exception as exc:  # noqa: BLE001
@@ -162,8 +234,9 @@ def load_preset(preset_name: str) -> List[MessageEntry]:
             if len(item) != 1:
                 raise LLMValidationError(f"预设 '{preset_name}' 第{idx + 1}项必须只包含一个角色键、preset键或preset-group键")
 
-            role, content = next(iter(item.items()))
-            if role not in ("system", "user", "assistant"):
+            raw_role, content = next(iter(item.items()))
+            role = _ROLE_CANON.get(raw_role)
+            if role is None:
                 raise LLMValidationError(f"预设 '{preset_name}' 第{idx + 1}项角色必须是 system/user/assistant")
             if not isinstance(content, str):
                 raise LLMValidationError(f"预设 '{preset_name}' 第{idx + 1}项内容必须是字符串")
@@ -175,24 +248,44 @@ def load_preset(preset_name: str) -> List[MessageEntry]:
             entries.append(MessageEntry(role=role, content=stripped, source=f"preset:{preset_name}"))
 
         logger.debug("成功加载预设 '%s'，包含 %d 条消息", preset_name, len(entries))
+        # 与 system 拼接结果一样，只缓存不引用其他文件的预设
+        if cached is not None and _is_self_contained(data):
+            cached[5] = tuple(_copy_entries(entries))
         return entries
 
 
 def get_preset_raw_content(preset_name: str) -> str:
     preset_file = _find_preset_file(preset_name, _iter_search_dirs("preset"))
     try:
-        with preset_file.open("r", encoding="utf-8") as stream:
-            return stream.read()
+        return _read_text(preset_file)
     except Exception as exc:  # noqa: BLE001
         raise LLMValidationError(f"预设 '{preset_name}' 读取失败: {exc}") from exc
 
 
+def _is_self_contained(data: Any) -> bool:
+    """预设内没有 preset/preset-group 引用时，结果只取决于该文件本身。"""
+    return isinstance(data, list) and not any(
+        isinstance(item, dict) and ("preset" in item or "preset-group" in item) for item in data
+    )
+
+
 def get_preset_system_content(preset_name: str) -> str:
+    preset_file = _find_preset_file(preset_name, _iter_search_dirs("preset"))
+    try:
+        cached = _cache_entry(preset_file)
+    except OSError:
+        cached = None
+    if cached is not None and cached[4] is not _UNPARSED:
+        return cached[4]
+
     entries = load_preset(preset_name)
     system_contents = [entry.content for entry in entries if entry.role == "system" and entry.content]
-    if not system_contents:
-        return ""
-    return "\n\n".join(system_contents)
+    result = "\n\n".join(system_contents) if system_contents else ""
+
+    # 仅缓存不依赖其他文件的预设，引用的预设变更时不会读到旧结果
+    if cached is not None and _is_self_contained(cached[3]):
+        cached[4] = result
+    return result
 
 
 def load_preset_group(group_name: str) -> List[MessageEntry]:
@@ -200,8 +293,7 @@ def load_preset_group(group_name: str) -> List[MessageEntry]:
         group_file = _find_preset_file(group_name, _iter_search_dirs("groups"))
 
         try:
-            with group_file.open("r", encoding="utf-8") as stream:
-                data = yaml.safe_load(stream)
+            data = _read_yaml(group_file)
         except yaml.YAMLError as exc:
             raise LLMValidationError(f"预设组 '{group_name}' YAML解析失败: {exc}") from exc
         except Exception as exc:  # noqa: BLE001
@@ -241,4 +333,5 @@ __all__ = [
     "load_preset_group",
     "get_preset_raw_content",
     "get_preset_system_content",
+    "clear_preset_cache",
 ]
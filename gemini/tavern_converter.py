@@ -5,8 +5,13 @@
 from __future__ import annotations
 import json
 import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm.parser import _YAMLDumper
+from llm.utils import _json_loads
 
 logger = logging.getLogger(__name__)
 
@@ -14,12 +19,31 @@ PRESET_MODULE_ROOT = Path(__file__).resolve().parents[1] / "llm" / "preset_modul
 DEFAULT_JSON_DIR = PRESET_MODULE_ROOT / "json"
 DEFAULT_PRESET_DIR = PRESET_MODULE_ROOT / "preset"
 
+# 酒馆预设中可转换的消息角色
+_VALID_ROLES = frozenset({"system", "user", "assistant"})
+# 酒馆预设中需要提取的 generation 参数
+_GEN_KEYS = ("temperature", "top_p", "top_k")
+
+# 待转换文件数达到该值时才启用进程池
+_PARALLEL_MIN_FILES = 4
+
 try:
     import yaml
 except ImportError as e:
     raise ImportError("需要 PyYAML: pip install pyyaml") from e
 
 
+def _yaml_sq(s: str) -> str:
+    """将单行字符串转为 YAML 单引号标量。
+
+    单引号标量内只需把 ``'`` 写成 ``''``；含控制字符等不可打印字符时
+    单引号无法表示，退回 yaml.dump 处理。
+    """
+    if s.isprintable() or s.replace("\t", " ").isprintable():
+        return "'" + s.replace("'", "''") + "'"
+    return yaml.dump(s, Dumper=_YAMLDumper, allow_unicode=True, default_style="'").strip()
+
+
 def convert_tavern_to_preset(json_path: str | Path, output_path: str | Path) -> bool:
     """
     将单个 SillyTavern JSON 预设文件转换为 YAML 格式。
@@ -42,8 +66,8 @@ def convert_tavern_to_preset(json_path: str | Path, output_path: str | Path) ->
 
     # 读取 JSON 文件
     try:
-        with json_path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
+        # 整体读入字节后一次解析（可用时走 orjson），避免文本模式边解码边解析
+        data = _json_loads(json_path.read_bytes())
     except FileNotFoundError:
         logger.error("文件不存在: %s", json_path)
         raise
@@ -57,8 +81,8 @@ def convert_tavern_to_preset(json_path: str | Path, output_path: str | Path) ->
         logger.warning("未找到 prompts: %s", json_path.name)
         return False
 
-    # 转换消息
-    yaml_content = []
+    # 转换消息：(注释, 角色, 内容)，marker 项的角色为 None
+    yaml_content: List[Tuple[str, Optional[str], str]] = []
 
     for prompt in prompts:
         # 提取基本信息
@@ -81,11 +105,11 @@ def convert_tavern_to_preset(json_path: str | Path, output_path: str | Path) ->
 
         # 如果是 marker 类型，只添加注释，不添加消息
         if marker:
-            yaml_content.append({"_comment": comment})
+            yaml_content.append((comment, None, ""))
             continue
 
         # 验证角色
-        if role not in ("system", "user", "assistant"):
+        if role not in _VALID_ROLES:
             logger.debug("跳过未知角色: %s (%s)", role, comment)
             continue
 
@@ -94,59 +118,45 @@ def convert_tavern_to_preset(json_path: str | Path, output_path: str | Path) ->
             logger.debug("跳过空消息: %s (%s)", role, comment)
             continue
 
-        # 构建消息条目
-        entry = {"_comment": comment} if comment else {}
-        entry[role] = content
-
-        yaml_content.append(entry)
+        yaml_content.append((comment, role, content))
 
     # 提取生成参数
-    generation_params = {}
-    if "temperature" in data:
-        generation_params["temperature"] = data["temperature"]
-    if "top_p" in data:
-        generation_params["top_p"] = data["top_p"]
-    if "top_k" in data:
-        generation_params["top_k"] = data["top_k"]
-
-    # 写入 YAML 文件
+    generation_params = {k: data[k] for k in _GEN_KEYS if k in data}
+
+    # 生成 YAML 文本：先在内存中拼接，最后一次性写入文件
     try:
+        out: List[str] = []
+        append = out.append
+        for comment, role, content in yaml_content:
+            # 写入注释
+            if comment:
+                append(f"# {comment}\n")
+
+            # 如果只有注释（marker类型），跳过消息写入
+            if role is None:
+                append("\n")
+                continue
+
+            # 手动写入 YAML 格式
+            # 判断内容是否包含特殊字符或换行
+            if not content:
+                # 空内容
+                append(f"- {role}: ''\n")
+            elif "\n" in content or content.startswith(" ") or content.endswith(" "):
+                # 多行内容，使用 literal style (|)
+                append(f"- {role}: |\n")
+                out.extend(f"    {line}\n" for line in content.split("\n"))
+            else:
+                # 单行内容，使用单引号标量
+                append(f"- {role}: {_yaml_sq(content)}\n")
+
+        # 注意：generation 参数不写入 preset 文件
+        # preset 只包含消息列表，generation 参数应在使用 preset 时的请求 YAML 中指定
+        if generation_params:
+            logger.debug("跳过 generation 参数: %s", generation_params)
+
         with output_path.open("w", encoding="utf-8") as f:
-            # 写入消息
-            for item in yaml_content:
-                # 写入注释
-                if "_comment" in item:
-                    comment = item.pop("_comment")
-                    f.write(f"# {comment}\n")
-
-                # 如果只有注释（marker类型），跳过消息写入
-                if not item:
-                    f.write("\n")
-                    continue
-
-                # 获取角色和内容
-                role = list(item.keys())[0]
-                content = item[role]
-
-                # 手动写入 YAML 格式
-                # 判断内容是否包含特殊字符或换行
-                if not content or content == "":
-                    # 空内容
-                    f.write(f"- {role}: ''\n")
-                elif "\n" in content or content.startswith(" ") or content.endswith(" "):
-                    # 多行内容，使用 literal style (|)
-                    f.write(f"- {role}: |\n")
-                    for line in content.split("\n"):
-                        f.write(f"    {line}\n")
-                else:
-                    # 单行内容，使用 yaml.dump 转义
-                    content_str = yaml.dump(content, allow_unicode=True, default_style="'").strip()
-                    f.write(f"- {role}: {content_str}\n")
-
-            # 注意：generation 参数不写入 preset 文件
-            # preset 只包含消息列表，generation 参数应在使用 preset 时的请求 YAML 中指定
-            if generation_params:
-                logger.debug("跳过 generation 参数: %s", generation_params)
+            f.write("".join(out))
 
         logger.info("✓ 转换成功: %s", output_path.name)
         return True
@@ -190,7 +200,14 @@ def batch_convert(
     preset_dir.mkdir(parents=True, exist_ok=True)
 
     # 扫描 JSON 文件
-    json_files = list(json_dir.glob("*.json"))
+    json_files: List[Path] = []
+    if json_dir.is_dir():
+        with os.scandir(json_dir) as entries:
+            json_files = [
+                Path(entry.path)
+                for entry in entries
+                if entry.name.endswith(".json") and entry.is_file()
+            ]
 
     if not json_files:
         logger.warning("未找到 JSON 文件: %s", json_dir)
@@ -217,7 +234,8 @@ def batch_convert(
         }
     }
 
-    # 逐个转换
+    # 先处理跳过逻辑，收集待转换的文件
+    pending: List[tuple[Path, Path]] = []
     for json_file in json_files:
         # 构建输出文件路径（替换扩展名）
         output_file = preset_dir / f"{json_file.stem}.yaml"
@@ -229,19 +247,35 @@ def batch_convert(
             stats["files"]["skipped"].append(json_file.name)
             continue
 
-        # 转换
-        try:
-            success = convert_tavern_to_preset(json_file, output_file)
-            if success:
-                stats["success"] += 1
-                stats["files"]["success"].append(json_file.name)
-            else:
-                stats["failed"] += 1
-                stats["files"]["failed"].append(json_file.name)
-        except Exception as exc:  # noqa: BLE001
-            logger.error("✗ 转换失败: %s - %s", json_file.name, exc)
-            stats["failed"] += 1
-            stats["files"]["failed"].append(json_file.name)
+        pending.append((json_file, output_file))
+
+    def _record(json_file: Path, success: bool) -> None:
+        key = "success" if success else "failed"
+        stats[key] += 1
+        stats["files"][key].append(json_file.name)
+
+    # 文件较少时进程池启动开销不划算，直接顺序转换
+    if len(pending) < _PARALLEL_MIN_FILES:
+        for json_file, output_file in pending:
+            try:
+                _record(json_file, convert_tavern_to_preset(json_file, output_file))
+            except Exception as exc:  # noqa: BLE001
+                logger.error("✗ 转换失败: %s - %s", json_file.name, exc)
+                _record(json_file, False)
+    else:
+        # 每个文件的转换相互独立且为 CPU 密集型，交给进程池并行处理
+        with ProcessPoolExecutor() as pool:
+            futures = {
+                pool.submit(convert_tavern_to_preset, json_file, output_file): json_file
+                for json_file, output_file in pending
+            }
+            for future in as_completed(futures):
+                json_file = futures[future]
+                try:
+                    _record(json_file, future.result())
+                except Exception as exc:  # noqa: BLE001
+                    logger.error("✗ 转换失败: %s - %s", json_file.name, exc)
+                    _record(json_file, False)
 
     # 输出统计
     logger.info("=" * 60)
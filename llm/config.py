@@ -2,11 +2,13 @@
 from __future__ import annotations
 
 import os
+import re
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-from dotenv import load_dotenv
+from dotenv import dotenv_values
 
 
 @dataclass
@@ -19,12 +21,53 @@ class RetryConfig:
     jitter: bool = True
 
 
+# 解析结果按 (mtime_ns, size) 缓存，文件未变化时无需重新读取
+_ENV_CACHE: Dict[str, Tuple[int, int, Dict[str, str]]] = {}
+_ENV_CACHE_LOCK = threading.Lock()
+
+# 单次 finditer 解析 KEY=VALUE 行；注释行/空行不匹配（行首 # 不是合法键名起始字符）
+_ENV_RE = re.compile(rb"^[ \t]*(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*([^\r\n]*)", re.MULTILINE)
+_INLINE_COMMENT_RE = re.compile(rb"[ \t]+#.*")
+# 出现引号、转义或变量插值时交给 python-dotenv 处理；其余简单行由 _parse_env_bytes 直接解析
+_COMPLEX_ENV_RE = re.compile(rb"[\"'\\]|\$\{")
+
+
+def _parse_env_bytes(data: bytes) -> Dict[str, str]:
+    values: Dict[str, str] = {}
+    for m in _ENV_RE.finditer(data):
+        value = m.group(2)
+        if b"#" in value:
+            value = _INLINE_COMMENT_RE.sub(b"", value)
+        values[m.group(1).decode()] = value.strip().decode("utf-8", "replace")
+    return values
+
+
 def load_env_file(path: str | os.PathLike[str] = ".env") -> None:
-    """Load a .env file into the environment if it exists."""
+    """Load a .env file into the environment if it exists.
+
+    Existing environment variables are never overridden.
+    """
     env_path = Path(path)
-    if not env_path.exists():
+    try:
+        st = env_path.stat()
+    except OSError:
         return
-    load_dotenv(dotenv_path=env_path, override=False)
+
+    key = str(env_path.resolve())
+    with _ENV_CACHE_LOCK:
+        cached = _ENV_CACHE.get(key)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            values = cached[2]
+        else:
+            data = env_path.read_bytes()
+            if _COMPLEX_ENV_RE.search(data):
+                values = {k: v for k, v in dotenv_values(env_path).items() if v is not None}
+            else:
+                values = _parse_env_bytes(data)
+            _ENV_CACHE[key] = (st.st_mtime_ns, st.st_size, values)
+
+    for k, v in values.items():
+        os.environ.setdefault(k, v)
 
 
 __all__ = ["RetryConfig", "load_env_file"]
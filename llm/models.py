@@ -1,6 +1,7 @@
 """Common data models."""
 from __future__ import annotations
 
+import sys
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional, Union
 
@@ -12,7 +13,13 @@ class ICSMessage:
     role: str
     content: Union[str, List[Dict[str, Any]]]
 
+    def __post_init__(self) -> None:
+        # 角色取值很少，驻留后各适配器中的角色比较可走指针相等的快路径
+        if type(self.role) is str:
+            self.role = sys.intern(self.role)
+
     def to_payload(self) -> Dict[str, Any]:
+        # 每次返回新 dict：格式指令等消息是进程级共享实例，调用方修改 payload 不能影响后续请求
         return {"role": self.role, "content": self.content}
 
 
@@ -35,15 +42,18 @@ class ICSRequest:
     routing: Dict[str, Any] = field(default_factory=dict)
     meta: Dict[str, Any] = field(default_factory=dict)
     format_config: Optional[Dict[str, Any]] = None
+    _payload: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
 
     def to_payload(self) -> Dict[str, Any]:
-        return {
-            "messages": [m.to_payload() for m in self.messages],
-            "generation": self.generation,
-            "routing": self.routing,
-            "meta": self.meta,
-            "format": self.format_config,
-        }
+        # 请求构建后不再修改；返回浅拷贝，messages 列表及其中的 dict 每次新建，调用方修改不会污染缓存
+        if self._payload is None:
+            self._payload = {
+                "generation": self.generation,
+                "routing": self.routing,
+                "meta": self.meta,
+                "format": self.format_config,
+            }
+        return {"messages": [m.to_payload() for m in self.messages], **self._payload}
 
 
 __all__ = ["ICSMessage", "MessageEntry", "ICSRequest"]
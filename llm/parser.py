@@ -1,7 +1,13 @@
 """YAML request parser."""
 from __future__ import annotations
 
-from typing import Any, Callable, Dict, List, Optional
+import logging
+import os
+import sys
+from copy import deepcopy
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Union
 
 from .exceptions import LLMValidationError
 from .models import MessageEntry
@@ -11,6 +17,41 @@ try:
 except ImportError as exc:  # pragma: no cover - import guard
     raise ImportError("需要 PyYAML: pip install pyyaml") from exc
 
+logger = logging.getLogger(__name__)
+
+# 优先使用 libyaml 的 C 实现，未编译 libyaml 时回退到纯 Python 版本
+try:
+    from yaml import CSafeDumper as _YAMLDumper
+    from yaml import CSafeLoader as _YAMLLoader
+except ImportError:  # pragma: no cover - 取决于 PyYAML 的构建方式
+    from yaml import SafeDumper as _YAMLDumper
+    from yaml import SafeLoader as _YAMLLoader
+    logger.debug("未检测到 libyaml，YAML 解析使用纯 Python 实现")
+else:
+    logger.debug("YAML 解析使用 libyaml C 加速")
+
+_FORMATS = frozenset({"text", "markdown", "json", "json_schema"})
+_MESSAGE_ROLES = frozenset({"system", "user", "assistant"})
+_FORMATS_HINT = ", ".join(sorted(_FORMATS))
+# 角色名的规范（驻留）对象，所有消息共享同一份字符串
+_ROLE_CANON = {role: sys.intern(role) for role in _MESSAGE_ROLES}
+_REQUIRED_ROLES = frozenset({"user"})
+_entry_role = attrgetter("role")
+
+# 超过该长度的 YAML 文本不进入解析缓存，避免缓存长期持有大字符串
+_PARSE_CACHE_MAX_CHARS = 64 * 1024
+
+
+@lru_cache(maxsize=256)
+def _load_yaml_cached(raw: str) -> Any:
+    """同一段 YAML 文本（如脚本中的常量提示词）只做一次词法/语法解析。
+
+    返回的结构在多次调用间共享：_from_data(shared=True) 会深拷贝交给调用方的
+    非消息字段，消息内容只读取不修改；解析异常不会被 lru_cache 缓存。
+    """
+    return yaml.load(raw, Loader=_YAMLLoader)
+
+
 PresetLoader = Callable[[str], List[MessageEntry]]
 _preset_loader: Optional[PresetLoader] = None
 
@@ -24,28 +65,61 @@ def register_preset_loader(loader: PresetLoader) -> None:
 class YAMLRequestParser:
     """Parser converting YAML prompts into internal message entries."""
 
-    REQUIRED = ("user",)
+    REQUIRED = tuple(sorted(_REQUIRED_ROLES))
     OPTIONAL = ("routing", "meta")
-    FORMATS = {"text", "markdown", "json", "json_schema"}
-    MESSAGE_ROLES = {"system", "user", "assistant"}
+    FORMATS = _FORMATS
+    MESSAGE_ROLES = _MESSAGE_ROLES
 
     @staticmethod
-    def parse(raw: str) -> Dict[str, Any]:
+    def parse(raw: Union[str, os.PathLike[str]]) -> Dict[str, Any]:
+        """Parse YAML text; a path-like object is read via :meth:`parse_path`."""
+        if isinstance(raw, os.PathLike):
+            return YAMLRequestParser.parse_path(raw)
+        shared = type(raw) is str and len(raw) <= _PARSE_CACHE_MAX_CHARS
         try:
-            data = yaml.safe_load(raw) or {}
+            if shared:
+                data = _load_yaml_cached(raw) or {}
+            else:
+                data = yaml.load(raw, Loader=_YAMLLoader) or {}
         except yaml.YAMLError as exc:
             raise LLMValidationError(f"YAML 解析失败: {exc}") from exc
+        return YAMLRequestParser._from_data(data, shared=shared)
+
+    @staticmethod
+    def parse_path(path: Union[str, os.PathLike[str]]) -> Dict[str, Any]:
+        """Parse a YAML prompt file.
 
+        The binary file object is handed to the loader directly so libyaml reads
+        it in chunks instead of first materialising the whole file as ``str``.
+        """
+        try:
+            with open(path, "rb") as fp:
+                data = yaml.load(fp, Loader=_YAMLLoader) or {}
+        except OSError as exc:
+            raise LLMValidationError(f"无法读取 YAML 文件 {path}: {exc}") from exc
+        except yaml.YAMLError as exc:
+            raise LLMValidationError(f"YAML 解析失败: {exc}") from exc
+        return YAMLRequestParser._from_data(data)
+
+    @staticmethod
+    def _from_data(data: Any, *, shared: bool = False) -> Dict[str, Any]:
+        """shared=True 表示 data 来自解析缓存：返回的 generation/routing/meta/format 及图片
+        contents 均为深拷贝（含 schema、tools 等嵌套对象），调用方修改结果不会污染缓存。"""
         if not isinstance(data, dict) or "messages" not in data:
             raise LLMValidationError("YAML 顶层必须包含 'messages'")
 
         message_entries = YAMLRequestParser._normalize_messages(data["messages"])
+        if shared:
+            for entry in message_entries:
+                if entry.images and entry.images["contents"]:
+                    entry.images["contents"] = deepcopy(entry.images["contents"])
+        copy_section = deepcopy if shared else dict
         result: Dict[str, Any] = {"messages": message_entries}
 
         generation = data.get("generation")
         fmt = None
         if generation and isinstance(generation, dict):
-            generation_copy = dict(generation)
+            generation_copy = copy_section(generation)
             fmt_raw = generation_copy.pop("format", None)
             if fmt_raw:
                 fmt = YAMLRequestParser._parse_fmt(fmt_raw)
@@ -55,7 +129,7 @@ class YAMLRequestParser:
         for section in YAMLRequestParser.OPTIONAL:
             val = data.get(section)
             if val and isinstance(val, dict):
-                result[section] = val
+                result[section] = copy_section(val)
 
         if fmt:
             result["format"] = fmt
@@ -64,11 +138,14 @@ class YAMLRequestParser:
     @staticmethod
     def _parse_fmt(raw: Any) -> Dict[str, Any]:
         if isinstance(raw, str):
+            # 常见情况：已是小写的合法格式名，无需 strip/lower
+            if raw in _FORMATS:
+                return {"type": raw}
             fmt_type = raw.strip().lower()
             if not fmt_type:
                 raise LLMValidationError("format 字符串不能为空")
-            if fmt_type not in YAMLRequestParser.FORMATS:
-                raise LLMValidationError(f"format 仅支持: {', '.join(sorted(YAMLRequestParser.FORMATS))}")
+            if fmt_type not in _FORMATS:
+                raise LLMValidationError(f"format 仅支持: {_FORMATS_HINT}")
             return {"type": fmt_type}
 
         if not isinstance(raw, dict):
@@ -78,12 +155,12 @@ class YAMLRequestParser:
         if fmt_type_raw is None:
             fmt_type = "text"
         elif isinstance(fmt_type_raw, str):
-            fmt_type = fmt_type_raw.strip().lower() or "text"
+            fmt_type = fmt_type_raw if fmt_type_raw in _FORMATS else fmt_type_raw.strip().lower() or "text"
         else:
             raise LLMValidationError("format.type 必须为字符串")
 
-        if fmt_type not in YAMLRequestParser.FORMATS:
-            raise LLMValidationError(f"format.type 仅支持: {', '.join(sorted(YAMLRequestParser.FORMATS))}")
+        if fmt_type not in _FORMATS:
+            raise LLMValidationError(f"format.type 仅支持: {_FORMATS_HINT}")
 
         parsed = {"type": fmt_type}
         if fmt_type == "json_schema":
@@ -106,25 +183,28 @@ class YAMLRequestParser:
         else:
             raise LLMValidationError("messages 必须是列表或字典")
 
-        if not any(entry.role == "user" for entry in entries):
-            raise LLMValidationError(f"缺少必填字段: {', '.join(YAMLRequestParser.REQUIRED)}")
+        # map + attrgetter 让逐条取 role 与集合差集都在 C 层完成
+        missing = _REQUIRED_ROLES.difference(map(_entry_role, entries))
+        if missing:
+            raise LLMValidationError(f"缺少必填字段: {', '.join(sorted(missing))}")
         return entries
 
     @staticmethod
     def _normalize_messages_from_list(raw_list: List[Any]) -> List[MessageEntry]:
+        # preset 会展开为不定数量的条目，无法预分配；热循环中的查找绑定为局部变量
         entries: List[MessageEntry] = []
+        append = entries.append
+        extract = YAMLRequestParser._extract_role_content
         for item in raw_list:
-            if isinstance(item, dict) and "preset" in item:
-                preset_name = item.get("preset")
+            if type(item) is dict and "preset" in item:
+                preset_name = item["preset"]
                 if not isinstance(preset_name, str):
                     raise LLMValidationError("preset 值必须为字符串")
                 if _preset_loader is None:
                     raise LLMValidationError("未注册预设加载器，无法解析 preset 引用")
-                preset_entries = _preset_loader(preset_name.strip())
-                entries.extend(preset_entries)
+                entries.extend(_preset_loader(preset_name.strip()))
             else:
-                entry = YAMLRequestParser._extract_role_content(item)
-                entries.append(entry)
+                append(extract(item))
         return entries
 
     @staticmethod
@@ -132,17 +212,19 @@ class YAMLRequestParser:
         entries: List[MessageEntry] = []
         for raw_key, raw_val in raw_dict.items():
             role = YAMLRequestParser._normalize_role(raw_key)
-            values = raw_val if isinstance(raw_val, list) else [raw_val]
+            # 角色相关的判断与同一键下的所有值无关，提到内层循环之外
+            required = role != "system"
+            source = None if required else "custom"
+            values = raw_val if isinstance(raw_val, list) else (raw_val,)
             for val in values:
                 if not isinstance(val, str):
                     raise LLMValidationError("messages.* 的值必须为字符串或字符串列表")
+                # 首尾无空白时 str.strip() 直接返回原对象，不会产生拷贝
                 content = val.strip()
-                if role in ("user", "assistant"):
-                    if not content:
+                if not content:
+                    if required:
                         raise LLMValidationError(f"{role} 必须为非空字符串")
-                elif not content:
                     continue
-                source = "custom" if role == "system" else None
                 entries.append(MessageEntry(role=role, content=content, source=source))
         return entries
 
@@ -155,17 +237,18 @@ class YAMLRequestParser:
             raise LLMValidationError("messages 列表项必须为对象")
 
         if "images" in item:
-            role = None
             content = ""
-            for possible_role in YAMLRequestParser.MESSAGE_ROLES:
-                if possible_role in item:
-                    role = possible_role
-                    role_content = item[possible_role]
-                    if not isinstance(role_content, str):
-                        raise LLMValidationError(f"{possible_role} 内容必须为字符串")
-                    content = role_content.strip()
-                    break
-            if role is None:
+            # 一次集合求交找出角色键，代替逐个角色的成员判断
+            role_hits = item.keys() & _MESSAGE_ROLES
+            if len(role_hits) > 1:
+                raise LLMValidationError(f"images 消息只能包含一个角色键: {', '.join(sorted(role_hits))}")
+            if role_hits:
+                role = next(iter(role_hits))
+                role_content = item[role]
+                if not isinstance(role_content, str):
+                    raise LLMValidationError(f"{role} 内容必须为字符串")
+                content = role_content.strip()
+            else:
                 role = "user"
 
             images_value = item["images"]
@@ -188,7 +271,8 @@ class YAMLRequestParser:
             if contents and not isinstance(contents, list):
                 raise LLMValidationError("contents 必须为列表")
 
-            return MessageEntry(role=role, content=content, images={"urls": urls, "contents": contents})
+            # 列表可能来自解析缓存，复制一份交给调用方
+            return MessageEntry(role=role, content=content, images={"urls": list(urls), "contents": list(contents)})
 
         if "role" in item and "content" in item:
             role = YAMLRequestParser._normalize_role(item["role"])
@@ -213,13 +297,18 @@ class YAMLRequestParser:
 
     @staticmethod
     def _normalize_role(raw_role: Any) -> str:
+        # 常见情况：YAML 中已是小写的合法角色名
+        if type(raw_role) is str:
+            canon = _ROLE_CANON.get(raw_role)
+            if canon is not None:
+                return canon
         token = str(raw_role).strip()
         if "." in token:
             prefix, suffix = token.split(".", 1)
             if prefix.strip().isdigit():
                 token = suffix.strip()
-        role = token.lower()
-        if role not in YAMLRequestParser.MESSAGE_ROLES:
+        role = _ROLE_CANON.get(token.lower())
+        if role is None:
             raise LLMValidationError("messages 仅支持 system/user/assistant 角色")
         return role
 
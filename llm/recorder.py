@@ -4,23 +4,36 @@ from __future__ import annotations
 import atexit
 import logging
 import os
+import queue
 import sqlite3
 import threading
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+_STOP = object()
+# 同一批记录连续写入失败的最大次数，超过后丢弃该批并记录错误，避免失败的批无限堆积
+_MAX_WRITE_ATTEMPTS = 5
+_EPOCH = datetime(1970, 1, 1)
+
 
 class UsageRecorder:
-    """Batching SQLite usage recorder."""
+    """Batching SQLite usage recorder.
+
+    ``record`` only enqueues the row; a dedicated daemon thread drains the
+    queue and writes batches over one persistent WAL-mode connection, so
+    SQLite latency never sits on the request path.
+    """
 
     def __init__(
         self,
         db_path: str | os.PathLike[str] | None = None,
         *,
-        batch_size: int = 10,
+        batch_size: int = 64,
+        max_interval: float = 1.0,
         auto_flush: bool = True,
         env_var: Optional[str] = "LLM_USAGE_DB",
         default_filename: str = "usage_log.db",
@@ -35,8 +48,19 @@ class UsageRecorder:
 
         self._db_path = Path(resolved_path)
         self._batch_size = batch_size
-        self._buffer: List[Tuple[Any, ...]] = []
-        self._lock = threading.Lock()
+        self._max_interval = max_interval
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        # close() 之后 record 改为持锁同步写入（先等待写线程退出）；锁同时保证关闭前入队的行都能被写线程处理
+        self._closed = False
+        self._state_lock = threading.Lock()
+        # 关闭后同步写入失败的行，下次 record 时重试
+        self._sync_batch: List[Tuple[Any, ...]] = []
+        self._write_failures = 0
+        # 持久连接：由 _ensure_table 创建，写线程启动后仅由写线程使用（出错后由写线程重建）
+        self._conn: Optional[sqlite3.Connection] = None
+        # 写线程格式化时间戳用的单项缓存：(秒, 已格式化前缀)
+        self._ts_sec = -1
+        self._ts_prefix = ""
 
         self._columns: List[Tuple[str, str]] = [
             ("timestamp", "TEXT"),
@@ -46,23 +70,37 @@ class UsageRecorder:
             ("prompt_tokens", "INTEGER"),
             ("completion_tokens", "INTEGER"),
             ("total_tokens", "INTEGER"),
+            # 整数 epoch 微秒，便于按时间范围做整数比较；timestamp 文本列保留以兼容已有数据与查询
+            ("timestamp_us", "INTEGER"),
         ]
         self._has_thoughts_column = supports_thoughts
         if self._has_thoughts_column:
             self._columns.append(("thoughts_token_count", "INTEGER"))
 
         self._ensure_table()
+        self._insert_sql = (
+            f"INSERT INTO usage_log ({', '.join(name for name, _ in self._columns)}) "
+            f"VALUES ({', '.join('?' for _ in self._columns)})"
+        )
+        self._writer = threading.Thread(target=self._writer_loop, name="usage-recorder", daemon=True)
+        self._writer.start()
+        self._atexit_registered = auto_flush
         if auto_flush:
-            atexit.register(self.flush)
+            atexit.register(self.close)
 
     def _ensure_table(self) -> None:
         self._db_path.parent.mkdir(parents=True, exist_ok=True)
-        with sqlite3.connect(self._db_path) as conn:
-            column_defs = ", ".join(f"{name} {sql_type}" for name, sql_type in self._columns)
+        # 建表与写入共用同一个持久连接；写线程启动前只在这里使用，之后只由写线程使用
+        conn = self._connect()
+        column_defs = ", ".join(f"{name} {sql_type}" for name, sql_type in self._columns)
+        conn.execute("BEGIN")
+        try:
+            # 不使用 AUTOINCREMENT：INTEGER PRIMARY KEY 本身即自动分配 rowid，
+            # 省去每次插入对 sqlite_sequence 的额外写入（已有表保持原结构不变）
             conn.execute(
                 f"""
                 CREATE TABLE IF NOT EXISTS usage_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id INTEGER PRIMARY KEY,
                     {column_defs}
                 )
                 """.strip()
@@ -71,7 +109,12 @@ class UsageRecorder:
             for name, sql_type in self._columns:
                 if name not in existing_columns:
                     conn.execute(f"ALTER TABLE usage_log ADD COLUMN {name} {sql_type}")
-            conn.commit()
+            # 按时间段/模型聚合是最常见的离线查询，避免全表扫描
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_ts_model ON usage_log(timestamp, model)")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
 
     def record(
         self,
@@ -83,42 +126,154 @@ class UsageRecorder:
     ) -> None:
         if not usage:
             return
-        values: List[Any] = [
-            datetime.utcnow().isoformat(),
+        # 时间戳记录为整数微秒，写库时再批量格式化出 ISO 字符串
+        now_us = time.time_ns() // 1000
+        values: Tuple[Any, ...] = (
+            now_us,
             model,
             request_id,
             trace_id,
             usage.get("prompt_tokens"),
             usage.get("completion_tokens"),
             usage.get("total_tokens"),
-        ]
+            now_us,
+        )
         if self._has_thoughts_column:
-            values.append(usage.get("thoughts_token_count"))
+            values += (usage.get("thoughts_token_count"),)
 
-        with self._lock:
-            self._buffer.append(tuple(values))
-            if len(self._buffer) >= self._batch_size:
-                self._flush()
+        with self._state_lock:
+            if not self._closed:
+                self._queue.put(values)
+                return
+            # 已关闭：等写线程完成最后的排空并关闭连接后，才能在当前线程使用连接与 _format_ts
+            self._writer.join()
+            self._sync_batch.append(values)
+            self._write_batch(self._sync_batch)
+            self._close_conn()
 
     def flush(self) -> None:
-        with self._lock:
-            self._flush()
-
-    def _flush(self) -> None:
-        if not self._buffer:
+        """Block until every row recorded so far has been written."""
+        done = threading.Event()
+        with self._state_lock:
+            closed = self._closed
+            if not closed:
+                # 持锁入队，保证事件排在 close() 的停止标记之前
+                self._queue.put(done)
+        if closed:
+            # 停止标记之后的事件不会被处理；写线程退出即表示已排空
+            self._writer.join()
             return
+        done.wait()
+
+    def close(self) -> None:
+        """Drain pending rows and stop the writer thread.
+
+        Rows recorded afterwards are written synchronously instead of queued.
+        """
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        if self._atexit_registered:
+            # 否则 atexit 会一直持有该实例的强引用
+            atexit.unregister(self.close)
+            self._atexit_registered = False
+        if self._writer.is_alive():
+            self._writer.join()
+
+    def _writer_loop(self) -> None:
+        batch: List[Tuple[Any, ...]] = []
+        deadline = 0.0
+        while True:
+            timeout = max(deadline - time.monotonic(), 0.0) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                if not self._write_batch(batch):
+                    deadline = time.monotonic() + self._max_interval
+                continue
+
+            if isinstance(item, tuple):
+                if not batch:
+                    deadline = time.monotonic() + self._max_interval
+                batch.append(item)
+                # 写入失败的行保留在 batch 中，等到 deadline 再重试，不随每条新记录反复尝试
+                if len(batch) >= self._batch_size and not self._write_failures and not self._write_batch(batch):
+                    deadline = time.monotonic() + self._max_interval
+                continue
+
+            if item is _STOP:
+                # 退出前尽量写完；_write_batch 在连续失败达到上限后会丢弃该批，循环必然结束
+                while batch and not self._write_batch(batch):
+                    time.sleep(0.05)
+                self._close_conn()
+                return
+            if not self._write_batch(batch):
+                deadline = time.monotonic() + self._max_interval
+            item.set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # autocommit 模式，事务由 _write_batch 显式控制；WAL + NORMAL 下每批只需一次轻量提交
+            conn = sqlite3.connect(self._db_path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            # 页缓存 8 MiB（负数单位为 KiB），并允许通过 mmap 读取最多 256 MiB
+            conn.execute("PRAGMA cache_size=-8192")
+            conn.execute("PRAGMA mmap_size=268435456")
+            self._conn = conn
+        return self._conn
+
+    def _close_conn(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception as exc:  # noqa: BLE001
+                logger.debug("关闭 usage 数据库连接失败: %s", exc)
+            self._conn = None
+
+    def _format_ts(self, ts_us: int) -> str:
+        """整数微秒 -> 与 ``datetime.isoformat()`` 相同的 UTC 文本。
+
+        同一秒内的记录复用已格式化的 ``YYYY-MM-DDTHH:MM:SS`` 前缀，只拼接微秒部分。
+        仅由写线程调用；关闭后的同步写入会先等待写线程退出，因此同一时刻只有一个线程调用。
+        """
+        sec, us = divmod(ts_us, 1_000_000)
+        if sec != self._ts_sec:
+            self._ts_sec = sec
+            self._ts_prefix = (_EPOCH + timedelta(seconds=sec)).isoformat()
+        return f"{self._ts_prefix}.{us:06d}" if us else self._ts_prefix
+
+    def _write_batch(self, batch: List[Tuple[Any, ...]]) -> bool:
+        """Write ``batch`` in one transaction; rows are cleared only once committed.
+
+        Returns ``False`` when the rows are kept for a later retry.
+        """
+        if not batch:
+            return True
+        rows = [(self._format_ts(row[0]),) + row[1:] for row in batch]
         try:
-            with sqlite3.connect(self._db_path) as conn:
-                column_names = ", ".join(name for name, _ in self._columns)
-                placeholders = ", ".join("?" for _ in self._columns)
-                conn.executemany(
-                    f"INSERT INTO usage_log ({column_names}) VALUES ({placeholders})",
-                    self._buffer,
-                )
-                conn.commit()
-            self._buffer.clear()
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(self._insert_sql, rows)
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
         except Exception as exc:  # noqa: BLE001
-            logger.error("写入 usage 失败: %s", exc)
+            # 连接可能已失效，下次写入时重新建立
+            self._close_conn()
+            self._write_failures += 1
+            if self._write_failures < _MAX_WRITE_ATTEMPTS:
+                logger.error("写入 usage 失败（%d 行保留待重试）: %s", len(batch), exc)
+                return False
+            logger.error("写入 usage 连续失败 %d 次，丢弃 %d 行: %s", self._write_failures, len(batch), exc)
+        self._write_failures = 0
+        batch.clear()
+        return True
 
     def __enter__(self):
         return self
@@ -1,17 +1,35 @@
 """Internal utility helpers."""
 from __future__ import annotations
 
+import asyncio
+import base64
+import dataclasses
 import functools
+import json
 import logging
 import random
 import time
-from typing import Any, Callable, TypeVar
+from datetime import date, datetime
+from typing import Any, Callable, Optional, TypeVar
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import pybase64
+except ImportError:  # pragma: no cover - optional dependency
+    pybase64 = None
 
 logger = logging.getLogger(__name__)
 
 T = TypeVar("T")
 _MISSING = object()
 
+# 可重试的 HTTP 状态码（超时、限流、服务端错误），其余 4xx 应立即失败
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
 
 def _get(obj: Any, key: str, default: Any = None) -> Any:
     """Get attribute or dict value while preserving falsy values."""
@@ -25,65 +43,142 @@ def _get(obj: Any, key: str, default: Any = None) -> Any:
     return default
 
 
-def _retry(config, is_async: bool = False):
-    """Retry decorator supporting sync and async callables."""
+def _attr_get(obj: Any, key: str) -> Any:
+    return getattr(obj, key, None)
+
+
+def _item_get(obj: Any, key: str) -> Any:
+    return obj.get(key)
+
+
+def _getter_for(obj: Any) -> Callable[[Any, str], Any]:
+    """Pick a field accessor once for a homogeneous response tree.
+
+    SDK responses are pydantic models all the way down while ``model_dump()``
+    output is dicts all the way down, so the type check is done only once.
+    """
+    return _item_get if isinstance(obj, dict) else _attr_get
+
+
+def _b64encode(data: bytes | bytearray | memoryview) -> bytes:
+    """Base64-encode to ``bytes``, using pybase64 (SIMD) when available."""
+    if pybase64 is not None:
+        return pybase64.b64encode(data)
+    return base64.b64encode(data)
+
+
+def _b64encode_str(data: bytes | bytearray | memoryview) -> str:
+    """Base64-encode bytes to an ASCII ``str``, using pybase64 (SIMD) when available."""
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode("ascii")
+
+
+def _json_loads(data: str | bytes) -> Any:
+    """Parse JSON, using orjson when available.
+
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can keep
+    catching the stdlib exception.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(
+    obj: Any,
+    *,
+    sort_keys: bool = False,
+    default: Optional[Callable[[Any], Any]] = None,
+) -> str:
+    """Serialize to a UTF-8 JSON string (non-ASCII kept as-is), using orjson when available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode()
+        except TypeError:
+            # orjson 不支持的类型（如非字符串 key、超大整数）回退到标准库
+            pass
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, default=default)
+
+
+def _debug_default(obj: Any) -> Any:
+    """``default`` hook for dumping debug payloads that contain SDK objects."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json", exclude_none=True)
+    if hasattr(obj, "to_payload"):
+        return obj.to_payload()
+    if isinstance(obj, (bytes, bytearray)):
+        return _b64encode_str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def dumps_debug(payload: Any) -> str:
+    """Serialize a ``dry_run`` / ``include_debug`` result to JSON.
+
+    Uses orjson when installed; SDK models, bytes and datetimes are converted
+    via :func:`_debug_default`.
+    """
+    return _json_dumps(payload, default=_debug_default)
+
+
+def _retry(config, is_async: bool = False, retry_on: Optional[Callable[[BaseException], bool]] = None):
+    """Retry decorator supporting sync and async callables.
+
+    ``retry_on`` decides whether an exception is transient; when it returns
+    False the exception propagates immediately. Without it every exception is
+    retried.
+    """
+
+    # 退避序列只与配置有关，装饰时一次性算好
+    delays = tuple(
+        min(config.initial_delay * (config.exponential_base ** i), config.max_delay)
+        for i in range(config.max_retries)
+    )
+    total = len(delays) + 1
+    jitter = config.jitter
 
     def decorator(func: Callable[..., T]) -> Callable[..., T]:
         if is_async:
 
             @functools.wraps(func)
             async def async_wrapper(*args, **kwargs) -> T:
-                import asyncio
-
-                last_exc = None
-                for attempt in range(config.max_retries + 1):
+                for attempt, delay in enumerate(delays):
                     try:
                         return await func(*args, **kwargs)
                     except Exception as exc:  # noqa: BLE001
-                        last_exc = exc
-                        if attempt >= config.max_retries:
-                            break
-                        delay = min(config.initial_delay * (config.exponential_base ** attempt), config.max_delay)
-                        if config.jitter:
+                        if retry_on is not None and not retry_on(exc):
+                            raise
+                        if jitter:
                             delay *= 0.5 + random.random()
-                        logger.warning(
-                            "请求失败 (%d/%d)，%.1fs 后重试: %s",
-                            attempt + 1,
-                            config.max_retries + 1,
-                            delay,
-                            exc,
-                        )
+                        logger.warning("请求失败 (%d/%d)，%.1fs 后重试: %s", attempt + 1, total, delay, exc)
                         await asyncio.sleep(delay)
-                raise last_exc
+                return await func(*args, **kwargs)
 
             return async_wrapper
 
         @functools.wraps(func)
         def sync_wrapper(*args, **kwargs) -> T:
-            last_exc = None
-            for attempt in range(config.max_retries + 1):
+            for attempt, delay in enumerate(delays):
                 try:
                     return func(*args, **kwargs)
                 except Exception as exc:  # noqa: BLE001
-                    last_exc = exc
-                    if attempt >= config.max_retries:
-                        break
-                    delay = min(config.initial_delay * (config.exponential_base ** attempt), config.max_delay)
-                    if config.jitter:
+                    if retry_on is not None and not retry_on(exc):
+                        raise
+                    if jitter:
                         delay *= 0.5 + random.random()
-                    logger.warning(
-                        "请求失败 (%d/%d)，%.1fs 后重试: %s",
-                        attempt + 1,
-                        config.max_retries + 1,
-                        delay,
-                        exc,
-                    )
+                    logger.warning("请求失败 (%d/%d)，%.1fs 后重试: %s", attempt + 1, total, delay, exc)
                     time.sleep(delay)
-            raise last_exc
+            return func(*args, **kwargs)
 
         return sync_wrapper
 
     return decorator
 
 
-__all__ = ["_get", "_retry"]
+__all__ = ["RETRYABLE_STATUS_CODES", "_MISSING", "dumps_debug", "_b64encode", "_b64encode_str", "_get", "_getter_for", "_json_dumps", "_json_loads", "_retry"]
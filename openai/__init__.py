@@ -3,11 +3,11 @@ import logging
 
 from llm.config import RetryConfig, load_env_file
 from llm.exceptions import LLMConfigError, LLMTransportError, LLMValidationError
-from llm.models import ICSMessage, ICSRequest
+from llm.models import ICSMessage, ICSRequest, MessageEntry
 from llm.parser import YAMLRequestParser
 from llm.recorder import UsageRecorder
 
-from .client import AsyncLLMClient, LLMClient
+from .client import AsyncLLMClient, LLMClient, reset_recorder
 from .config import LLMAPIConfig
 
 logger = logging.getLogger(__name__)
@@ -20,10 +20,12 @@ __all__ = [
     "RetryConfig",
     "load_env_file",
     "UsageRecorder",
+    "reset_recorder",
     "LLMConfigError",
     "LLMValidationError",
     "LLMTransportError",
     "ICSMessage",
     "ICSRequest",
+    "MessageEntry",
     "YAMLRequestParser",
 ]
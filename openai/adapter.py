@@ -7,48 +7,46 @@ from llm.models import ICSRequest
 
 from .format import FormatHandler
 
+# 不直接透传到请求体的 generation 键
+_SPECIAL_GEN_KEYS = frozenset({"model", "think", "max_output_tokens"})
+
 
 class OpenAIAdapter:
     """OpenAI 适配器。"""
     @staticmethod
     def to_chat(ics: ICSRequest) -> Dict[str, Any]:
         gen = ics.generation
-        payload = {"model": gen.get("model"), "messages": [m.to_payload() for m in ics.messages]}
-        if not payload["model"]:
+        model = gen.get("model")
+        if not model:
             raise LLMConfigError("缺少模型参数")
+        payload = {"model": model, "messages": [m.to_payload() for m in ics.messages]}
 
-        # 处理 think 参数（Gemini thinking_config）
-        think_value = None
-
-        for k, v in gen.items():
-            if k == "model":
-                continue
-            if k == "think":
-                # 记录 think 值，稍后处理
-                think_value = v
-                continue
-            if k == "max_output_tokens":
-                payload["max_tokens"] = v
-            else:
-                payload[k] = v
+        # 其余生成参数原样透传，需要改名/改结构的键单独处理
+        payload.update({k: v for k, v in gen.items() if k not in _SPECIAL_GEN_KEYS})
+        if "max_output_tokens" in gen:
+            payload["max_tokens"] = gen["max_output_tokens"]
 
-        # 如果有 think 参数，添加到 extra_body
+        # 处理 think 参数（Gemini thinking_config）
+        think_value = gen.get("think")
         if think_value is not None:
-            extra_body = payload.get("extra_body", {})
-            # 确保 extra_body 内部结构存在（双层嵌套）
-            if "extra_body" not in extra_body:
-                extra_body["extra_body"] = {}
-            if "google" not in extra_body["extra_body"]:
-                extra_body["extra_body"]["google"] = {}
-
-            # 添加 thinking_config
             thinking_config = {"thinkingBudget": think_value}
             # 当 think=-1 时，启用思考总结
             if think_value == -1:
                 thinking_config["includeThoughts"] = True
 
-            extra_body["extra_body"]["google"]["thinking_config"] = thinking_config
-            payload["extra_body"] = extra_body
+            extra_body = payload.get("extra_body")
+            if extra_body is None:
+                # 常见情况：直接构造双层嵌套结构
+                payload["extra_body"] = {"extra_body": {"google": {"thinking_config": thinking_config}}}
+            else:
+                # 合并进调用方提供的 extra_body，逐层复制避免修改 generation 中的原字典
+                extra_body = dict(extra_body)
+                inner = dict(extra_body.get("extra_body") or {})
+                google = dict(inner.get("google") or {})
+                google["thinking_config"] = thinking_config
+                inner["google"] = google
+                extra_body["extra_body"] = inner
+                payload["extra_body"] = extra_body
 
         fmt = FormatHandler.response_format(ics.format_config)
         if fmt:
@@ -2,45 +2,191 @@
 from __future__ import annotations
 
 import logging
-import uuid
+import mimetypes
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from llm.exceptions import LLMConfigError, LLMValidationError
 from llm.models import ICSMessage, ICSRequest, MessageEntry
 from llm.parser import YAMLRequestParser
+from llm.utils import _b64encode
 
 from .config import LLMAPIConfig
 from .format import FormatHandler
 
+try:
+    import requests
+    import requests.adapters
+except ImportError:  # pragma: no cover - optional dependency
+    requests = None
+
 logger = logging.getLogger(__name__)
 
+_GEMINI_OPENAI_HOST = "generativelanguage.googleapis.com"
+_IMAGE_WORKERS = 8
+# 本地图片编码缓存上限：条目数、总字节数，以及可缓存的单个文件大小
+_IMAGE_CACHE_MAX_ENTRIES = 64
+_IMAGE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+_IMAGE_CACHE_MAX_FILE = 16 * 1024 * 1024
+
+# 常见图片扩展名的 MIME 类型，命中时无需查询 mimetypes 数据库
+_EXT_MIME = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".bmp": "image/bmp",
+}
+
+# 图片分块编码的块大小：3 的倍数，保证块之间不会出现 base64 填充
+_B64_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def _guess_image_mime(path: Path) -> str:
+    """根据扩展名推断图片 MIME 类型，无法识别时默认 image/jpeg。"""
+    suffix = path.suffix.lower()
+    mime_type = _EXT_MIME.get(suffix)
+    if mime_type is None:
+        mime_type, _ = mimetypes.guess_type(path.name)
+        if not mime_type or not mime_type.startswith("image/"):
+            mime_type = "image/jpeg"  # 默认类型
+    return mime_type
+
+
+def _encode_data_uri(mime_type: str, chunks: Iterable[bytes], size_hint: int = 0) -> str:
+    """将字节块流式编码为 base64 data URI，峰值内存约为一份编码结果。
+
+    ``size_hint`` 为原始字节数（未知时传 0），用于预分配输出缓冲区。
+    """
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    out = bytearray(len(prefix) + (size_hint + 2) // 3 * 4)
+    out[: len(prefix)] = prefix
+    pos = len(prefix)
+    carry = b""
+    for chunk in chunks:
+        if carry:
+            chunk = carry + chunk
+        # 只编码 3 的整数倍字节，余数留到下一块，避免中途出现填充
+        cut = len(chunk) - len(chunk) % 3
+        encoded = _b64encode(memoryview(chunk)[:cut])
+        out[pos : pos + len(encoded)] = encoded
+        pos += len(encoded)
+        carry = chunk[cut:]
+    if carry:
+        encoded = _b64encode(carry)
+        out[pos : pos + len(encoded)] = encoded
+        pos += len(encoded)
+    # 预估偏大（或文件在读取期间变短）时截掉多余部分
+    del out[pos:]
+    # 请求体由 SDK 序列化为 JSON，需要 str；ASCII 解码只是一次内存拷贝
+    return out.decode("ascii")
+
 
 class ICSBuilder:
     """ICS 构建器。"""
     def __init__(self, config: LLMAPIConfig):
         self._config = config
+        inline = config.inline_remote_images
+        if inline is None:
+            # Gemini 的 OpenAI 兼容接口对在线 URL 支持有限，其余服务直接透传 URL
+            inline = _GEMINI_OPENAI_HOST in (config.base_url or "")
+        self._inline_remote_images = inline
+        # 下载在线图片用的连接池会话，首次需要时创建，复用 TCP/TLS 连接
+        self._http: Optional["requests.Session"] = None
+        # 多图并行处理的线程池，首次需要时创建
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # 本地图片编码结果缓存：(绝对路径, mtime_ns, size) -> data URI，按总字节数 LRU 淘汰
+        self._image_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._image_cache_bytes = 0
+
+    def _image_cache_get(self, key: Tuple[str, int, int]) -> Optional[str]:
+        with self._lock:
+            data_uri = self._image_cache.get(key)
+            if data_uri is not None:
+                self._image_cache.move_to_end(key)
+            return data_uri
 
-    def build(self, parsed: Dict[str, Any]) -> ICSRequest:
+    def _image_cache_put(self, key: Tuple[str, int, int], data_uri: str) -> None:
+        with self._lock:
+            previous = self._image_cache.pop(key, None)
+            if previous is not None:
+                self._image_cache_bytes -= len(previous)
+            self._image_cache[key] = data_uri
+            self._image_cache_bytes += len(data_uri)
+            while self._image_cache_bytes > _IMAGE_CACHE_MAX_BYTES or len(self._image_cache) > _IMAGE_CACHE_MAX_ENTRIES:
+                _, evicted = self._image_cache.popitem(last=False)
+                self._image_cache_bytes -= len(evicted)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=_IMAGE_WORKERS, thread_name_prefix="oai-image")
+            return self._pool
+
+    def _http_session(self) -> "requests.Session":
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._http = session
+        return self._http
+
+    def close(self) -> None:
+        """关闭图片下载会话与线程池（如已创建）。"""
+        with self._lock:
+            http, self._http = self._http, None
+            pool, self._pool = self._pool, None
+        if http is not None:
+            http.close()
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    @staticmethod
+    def has_images(parsed: Dict[str, Any]) -> bool:
+        """请求中是否包含需要处理的图片（处理图片涉及磁盘/网络 I/O）。"""
+        msgs = parsed.get("messages")
+        return isinstance(msgs, list) and any(isinstance(m, MessageEntry) and m.images for m in msgs)
+
+    def build(self, parsed: Dict[str, Any], *, trace_id: Optional[str] = None) -> ICSRequest:
         msgs = parsed["messages"]
         base_msgs = self._build_message_chain(msgs)
 
-        gen = dict(parsed.get("generation", {}))
-        model = gen.get("model") or self._config.default_model
-        if not model:
-            raise LLMConfigError("未提供模型")
-        gen["model"] = model
+        # generation/routing/meta 直接引用 parsed 中的字典（ICSRequest 与其共享）；
+        # 仅在确实需要改写时才复制（写时复制），调用方传入的 parsed 始终不被修改
+        gen = parsed.get("generation") or {}
+        if not gen.get("model"):
+            model = self._config.default_model
+            if not model:
+                raise LLMConfigError("未提供模型")
+            gen = {**gen, "model": model}
 
-        routing = dict(parsed.get("routing", {}))
-        meta = dict(parsed.get("meta", {}))
-        meta.setdefault("trace_id", str(uuid.uuid4()))
+        routing = parsed.get("routing") or {}
+        meta = parsed.get("meta") or {}
+        # 调用方已生成 trace_id 时直接沿用，避免重复生成；客户端的 trace_id 通常正取自 meta，无需改写
+        current = meta.get("trace_id")
+        if trace_id:
+            if current != trace_id:
+                meta = {**meta, "trace_id": trace_id}
+        elif not current:
+            meta = {**meta, "trace_id": secrets.token_hex(16)}
 
         fmt = parsed.get("format")
         extra = FormatHandler.build_messages(fmt)
         system_extra = [m for m in extra if m.role == "system"]
         other_extra = [m for m in extra if m.role != "system"]
 
-        messages = list(base_msgs)
+        # base_msgs 由 _build_message_chain 新建，可直接原地插入
+        messages = base_msgs
         if system_extra:
             insert_at = next((idx for idx, msg in enumerate(messages) if msg.role != "system"), len(messages))
             messages[insert_at:insert_at] = system_extra
@@ -58,22 +204,24 @@ class ICSBuilder:
 
     def _build_from_entries(self, entries: List[Dict[str, Any]]) -> List[ICSMessage]:
         messages: List[ICSMessage] = []
+        # 长历史下循环体以解释器开销为主，常用名称绑定为局部变量
+        append = messages.append
+        roles = YAMLRequestParser.MESSAGE_ROLES
         for entry in entries:
-            if isinstance(entry, MessageEntry):
+            if type(entry) is MessageEntry:
                 # 检查是否包含图片（多模态消息）
                 if entry.images:
-                    content = self._build_multimodal_content(entry)
-                    messages.append(ICSMessage(role=entry.role, content=content))
+                    append(ICSMessage(role=entry.role, content=self._build_multimodal_content(entry)))
                 else:
-                    messages.append(ICSMessage(role=entry.role, content=entry.content))
+                    append(ICSMessage(role=entry.role, content=entry.content))
                 continue
             role = entry.get("role")
             content = entry.get("content")
-            if role not in YAMLRequestParser.MESSAGE_ROLES:
+            if role not in roles:
                 raise LLMValidationError(f"不支持的消息角色: {role}")
-            if not isinstance(content, str):
+            if type(content) is not str:
                 raise LLMValidationError("消息内容必须为字符串")
-            messages.append(ICSMessage(role=role, content=content))
+            append(ICSMessage(role=role, content=content))
         return messages
 
     def _build_multimodal_content(self, entry: MessageEntry) -> List[Dict[str, Any]]:
@@ -90,9 +238,12 @@ class ICSBuilder:
         # 处理图片
         if entry.images:
             urls = entry.images.get("urls", [])
-            for url in urls:
-                # 处理 URL（本地路径转在线链接）
-                processed_url = self._process_image_url(url)
+            # 每张图片的读取/下载相互独立且以 I/O 为主，多张时并行处理（结果保持原顺序）
+            if len(urls) > 1:
+                processed_urls = list(self._get_pool().map(self._process_image_url, urls))
+            else:
+                processed_urls = [self._process_image_url(url) for url in urls]
+            for processed_url in processed_urls:
                 content_parts.append({
                     "type": "image_url",
                     "image_url": {"url": processed_url}
@@ -104,57 +255,70 @@ class ICSBuilder:
         """处理图片 URL，统一转换为 base64 data URI。
 
         注意：Gemini 的 OpenAI 兼容接口对直接 URL 支持有限，
-        使用 base64 编码是最可靠的方案。
+        因此仅在 inline_remote_images 开启（或自动识别为 Gemini 接口）时
+        才下载在线图片并转为 base64，其余情况原样透传 URL。
         """
-        import base64
-        import mimetypes
+        # 调用方已提供 data URI 时原样返回
+        if url.startswith("data:"):
+            return url
 
-        # 检查是否为本地文件路径
-        path = Path(url)
-        if path.exists():
-            # 本地文件：读取并转换为 base64
+        # 检查是否为 HTTP(S) URL
+        if url.startswith(("http://", "https://")):
+            if not self._inline_remote_images:
+                return url
+            # 在线 URL：流式下载并同时编码为 base64
+            if requests is None:
+                logger.error("requests 库未安装，无法下载在线图片")
+                raise LLMValidationError("下载在线图片需要 requests 库: pip install requests")
             try:
-                with open(path, "rb") as image_file:
-                    image_data = image_file.read()
-                    base64_image = base64.b64encode(image_data).decode('utf-8')
+                with self._http_session().get(url, stream=True, timeout=30) as response:
+                    response.raise_for_status()
 
-                # 检测 MIME 类型
-                mime_type, _ = mimetypes.guess_type(str(path))
-                if not mime_type or not mime_type.startswith('image/'):
-                    mime_type = 'image/jpeg'  # 默认类型
+                    # 从响应头获取 MIME 类型
+                    mime_type = response.headers.get('Content-Type', 'image/jpeg')
+                    if not mime_type.startswith('image/'):
+                        mime_type = 'image/jpeg'
 
-                data_uri = f"data:{mime_type};base64,{base64_image}"
-                logger.info("本地图片已编码为 base64: %s (%d 字符)", url, len(base64_image))
+                    size_header = response.headers.get('Content-Length', '')
+                    size = int(size_header) if size_header.isdigit() else 0
+                    data_uri = _encode_data_uri(
+                        mime_type, response.iter_content(chunk_size=_B64_CHUNK_SIZE), size
+                    )
+                logger.info("在线图片已下载并编码为 base64: %s (%d 字符)", url, len(data_uri))
                 return data_uri
             except Exception as exc:  # noqa: BLE001
-                logger.error("读取本地图片失败 %s: %s", url, exc)
-                raise LLMValidationError(f"读取本地图片失败: {url}, 错误: {exc}")
-
-        # 检查是否为 HTTP(S) URL
-        if url.startswith(("http://", "https://")):
-            # 在线 URL：下载后转换为 base64
-            try:
-                import requests
-                response = requests.get(url, timeout=30)
-                response.raise_for_status()
+                logger.error("下载在线图片失败 %s: %s", url, exc)
+                raise LLMValidationError(f"下载在线图片失败: {url}, 错误: {exc}")
 
-                image_data = response.content
-                base64_image = base64.b64encode(image_data).decode('utf-8')
+        # 检查是否为本地文件路径
+        path = Path(url)
+        try:
+            st = path.stat()
+        except OSError:
+            st = None
+        if st is not None:
+            # 同一文件未变更时直接复用之前的编码结果
+            cache_key = (os.path.abspath(url), st.st_mtime_ns, st.st_size)
+            cached = self._image_cache_get(cache_key)
+            if cached is not None:
+                logger.debug("本地图片命中编码缓存: %s", url)
+                return cached
 
-                # 从响应头获取 MIME 类型
-                mime_type = response.headers.get('Content-Type', 'image/jpeg')
-                if not mime_type.startswith('image/'):
-                    mime_type = 'image/jpeg'
+            # 本地文件：分块读取并流式编码为 base64
+            try:
+                mime_type = _guess_image_mime(path)
 
-                data_uri = f"data:{mime_type};base64,{base64_image}"
-                logger.info("在线图片已下载并编码为 base64: %s (%d 字符)", url, len(base64_image))
+                with open(path, "rb") as image_file:
+                    data_uri = _encode_data_uri(
+                        mime_type, iter(lambda: image_file.read(_B64_CHUNK_SIZE), b""), st.st_size
+                    )
+                logger.info("本地图片已编码为 base64: %s (%d 字符)", url, len(data_uri))
+                if st.st_size <= _IMAGE_CACHE_MAX_FILE:
+                    self._image_cache_put(cache_key, data_uri)
                 return data_uri
-            except ImportError:
-                logger.error("requests 库未安装，无法下载在线图片")
-                raise LLMValidationError("下载在线图片需要 requests 库: pip install requests")
             except Exception as exc:  # noqa: BLE001
-                logger.error("下载在线图片失败 %s: %s", url, exc)
-                raise LLMValidationError(f"下载在线图片失败: {url}, 错误: {exc}")
+                logger.error("读取本地图片失败 %s: %s", url, exc)
+                raise LLMValidationError(f"读取本地图片失败: {url}, 错误: {exc}")
 
         # 既不是本地路径也不是 HTTP URL
         logger.warning("无法识别的图片路径: %s", url)
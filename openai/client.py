@@ -1,15 +1,19 @@
 """LLM 客户端。"""
 from __future__ import annotations
+import asyncio
+import functools
 import logging
+import os
+import re
+import secrets
 import time
-import uuid
 from typing import Any, Dict, Optional, Union
 
 from llm.config import RetryConfig
 from llm.exceptions import LLMConfigError, LLMTransportError, LLMValidationError
 from llm.parser import YAMLRequestParser
 from llm.recorder import UsageRecorder
-from llm.utils import _get, _retry
+from llm.utils import RETRYABLE_STATUS_CODES, _get, _getter_for, _retry, dumps_debug
 
 from .adapter import OpenAIAdapter
 from .builder import ICSBuilder
@@ -17,6 +21,7 @@ from .config import LLMAPIConfig
 from .format import FormatHandler
 
 try:
+    import httpx
     from openai import AsyncOpenAI, OpenAI
     import openai
 except ImportError as e:
@@ -24,6 +29,37 @@ except ImportError as e:
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_CONNECTIONS = 1000
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 200
+DEFAULT_KEEPALIVE_EXPIRY = 300.0
+
+_THOUGHT_RE = re.compile(r"<thought>(.*?)</thought>", re.DOTALL)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_recorder() -> UsageRecorder:
+    """进程内共享的默认用量记录器；首次记录用量时才建库建表，导入与构造客户端均不触碰磁盘。"""
+    return UsageRecorder(env_var="LLM_USAGE_DB", default_filename="usage_log.db")
+
+
+def reset_recorder() -> None:
+    """丢弃缓存的默认记录器（测试中切换 LLM_USAGE_DB 后使用），下次记录时重新创建。"""
+    recorder = _get_recorder() if _get_recorder.cache_info().currsize else None
+    _get_recorder.cache_clear()
+    if recorder is not None:
+        recorder.close()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """仅对网络错误、超时、限流与 5xx 重试；其余错误（如鉴权、参数错误）立即抛出。"""
+    cause = exc.__cause__ if isinstance(exc, LLMTransportError) else exc
+    # APITimeoutError 是 APIConnectionError 的子类
+    if isinstance(cause, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(cause, openai.APIStatusError):
+        return cause.status_code in RETRYABLE_STATUS_CODES
+    return False
+
 
 class _BaseLLMClient:
     """LLM 客户端基类（提取公共方法）。"""
@@ -32,32 +68,64 @@ class _BaseLLMClient:
     ValidationError = LLMValidationError
     TransportError = LLMTransportError
 
-    def __init__(self, config: LLMAPIConfig, recorder: Optional[UsageRecorder], retry_config: Optional[RetryConfig]):
+    def __init__(
+        self,
+        config: LLMAPIConfig,
+        recorder: Optional[UsageRecorder],
+        retry_config: Optional[RetryConfig],
+        *,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    ):
         self._config = config
         self._builder = ICSBuilder(config)
-        self._recorder = recorder or UsageRecorder(env_var="LLM_USAGE_DB", default_filename="usage_log.db")
+        # 未显式传入时延迟到 _record_usage 再取共享的默认记录器
+        self._recorder = recorder
         self._retry_config = retry_config or RetryConfig()
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY,
+        )
+
+    def _client_kwargs(self) -> Dict[str, Any]:
+        kwargs = {"api_key": self._config.api_key, "base_url": self._config.base_url}
+        if self._config.organization:
+            kwargs["organization"] = self._config.organization
+        return kwargs
+
+    @staticmethod
+    def dumps_debug(payload: Any) -> str:
+        """将 dry_run / include_debug 的返回值序列化为 JSON（安装 orjson 时走快速路径）。"""
+        return dumps_debug(payload)
+
+    @staticmethod
+    def _resolve_trace_id(parsed: Dict[str, Any]) -> str:
+        """沿用 YAML meta 中的 trace_id，否则生成一次；结果显式传给 builder，不修改 parsed。"""
+        meta = parsed.get("meta") or {}
+        return meta.get("trace_id") or secrets.token_hex(16)
 
     def _extract_result(self, resp: Any, fmt_cfg: Optional[Dict[str, Any]]) -> Any:
-        choice = None
-        try:
-            choice = resp.choices[0]
-        except:
-            choices = _get(resp, "choices")
-            if isinstance(choices, list) and choices:
-                choice = choices[0]
+        # _get 先 getattr 再回退到字典取值，SDK 对象与 model_dump() 字典都只查找一次
+        choices = _get(resp, "choices")
+        choice = choices[0] if isinstance(choices, list) and choices else None
         if not choice:
             return FormatHandler.process(resp.model_dump() if hasattr(resp, "model_dump") else resp, fmt_cfg)
 
-        msg = _get(choice, "message")
+        get = _getter_for(choice)
+        msg = get(choice, "message")
         if not msg:
             return FormatHandler.process(choice, fmt_cfg)
 
-        parsed = _get(msg, "parsed")
+        parsed = get(msg, "parsed")
         if parsed is not None:
             return FormatHandler.process(parsed, fmt_cfg)
 
-        content = _get(msg, "content")
+        content = get(msg, "content")
+
+        # 最常见情况：普通字符串且不含 <thought>，无需后续处理
+        if type(content) is str and "<thought>" not in content:
+            return FormatHandler.process(content, fmt_cfg)
 
         # 检查是否有思考总结（Gemini thinking mode）
         # 情况 1: content 是列表（parts）
@@ -65,16 +133,19 @@ class _BaseLLMClient:
             # 提取 thought 和 text parts
             thoughts = []
             texts = []
+            # 每个 part 只取一次 type，append 绑定为局部变量，减少长列表上的属性查找
+            add_thought = thoughts.append
+            add_text = texts.append
             for part in content:
-                if isinstance(part, dict):
-                    if part.get("type") == "thought":
-                        thought_text = part.get("thought", "")
-                        if thought_text:
-                            thoughts.append(thought_text)
-                    elif part.get("type") == "text":
-                        text_content = part.get("text", "")
-                        if text_content:
-                            texts.append(text_content)
+                if type(part) is not dict:
+                    continue
+                ptype = part.get("type")
+                if ptype == "text":
+                    if text_content := part.get("text"):
+                        add_text(text_content)
+                elif ptype == "thought":
+                    if thought_text := part.get("thought"):
+                        add_thought(thought_text)
 
             # 如果有思考总结，格式化为易读文本
             if thoughts:
@@ -88,73 +159,101 @@ class _BaseLLMClient:
 
         # 情况 2: content 是字符串，可能包含 <thought> 标签
         elif isinstance(content, str) and "<thought>" in content:
-            import re
-            # 提取 <thought>...</thought> 内容
-            thought_pattern = r'<thought>(.*?)</thought>'
-            thought_matches = re.findall(thought_pattern, content, re.DOTALL)
+            # 单次扫描：同时收集 <thought> 内容与标签之间的答案片段
+            thoughts = []
+            answer_parts = []
+            pos = 0
+            for match in _THOUGHT_RE.finditer(content):
+                answer_parts.append(content[pos:match.start()])
+                thoughts.append(match.group(1).strip())
+                pos = match.end()
 
-            if thought_matches:
+            if thoughts:
                 # 移除所有 <thought> 标签，剩余内容为答案
-                answer = re.sub(thought_pattern, '', content, flags=re.DOTALL).strip()
+                answer_parts.append(content[pos:])
+                answer = "".join(answer_parts).strip()
 
                 # 格式化为易读的文本格式
-                thought_text = "\n\n".join(m.strip() for m in thought_matches)
+                thought_text = "\n\n".join(thoughts)
                 formatted_output = f"<LLM_THINKING>\n{thought_text}\n</LLM_THINKING>\n\n{answer}"
                 return formatted_output
 
         return FormatHandler.process(content, fmt_cfg)
 
     def _record_usage(self, resp: Any, trace_id: Optional[str]):
-        usage_obj = _get(resp, "usage")
+        get = _getter_for(resp)
+        usage_obj = get(resp, "usage")
         usage_dict = None
         if usage_obj:
             if hasattr(usage_obj, "model_dump"):
                 usage_dict = usage_obj.model_dump()
             elif isinstance(usage_obj, dict):
                 usage_dict = usage_obj
-        self._recorder.record(model=_get(resp, "model"), request_id=_get(resp, "id"), trace_id=trace_id, usage=usage_dict)
+        recorder = self._recorder or _get_recorder()
+        recorder.record(model=get(resp, "model"), request_id=get(resp, "id"), trace_id=trace_id, usage=usage_dict)
 
 
 class LLMClient(_BaseLLMClient):
     """同步 LLM 客户端。"""
-    def __init__(self, config: LLMAPIConfig, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None):
-        super().__init__(config, recorder, retry_config)
+    def __init__(
+        self,
+        config: LLMAPIConfig,
+        recorder: Optional[UsageRecorder] = None,
+        retry_config: Optional[RetryConfig] = None,
+        *,
+        http_client: Optional[httpx.Client] = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    ):
+        super().__init__(
+            config,
+            recorder,
+            retry_config,
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        # 传入的 http_client 由调用方负责关闭，便于多个客户端共享连接池
+        self._owns_http_client = http_client is None
+        # DefaultHttpxClient 保留 SDK 自身的默认设置（超时、follow_redirects 等），只覆盖连接池上限
+        self._http_client = http_client or openai.DefaultHttpxClient(limits=self._limits)
         self._openai_client = self._create_openai_client()
 
     @classmethod
-    def from_env(cls, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None):
-        return cls(LLMAPIConfig.from_env(), recorder, retry_config)
+    def from_env(cls, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None, **kwargs: Any):
+        return cls(LLMAPIConfig.from_env(), recorder, retry_config, **kwargs)
 
-    def invoke_from_yaml(self, yaml_prompt: str, *, dry_run: bool = False, include_debug: bool = False) -> Union[Any, Dict[str, Any]]:
-        start = time.time()
-        trace_id = str(uuid.uuid4())
-        logger.info("处理请求 trace_id=%s dry_run=%s", trace_id, dry_run)
+    def invoke_from_yaml(self, yaml_prompt: Union[str, os.PathLike[str]], *, dry_run: bool = False, include_debug: bool = False) -> Union[Any, Dict[str, Any]]:
+        # INFO 未开启时跳过计时与日志调用
+        log_info = logger.isEnabledFor(logging.INFO)
+        start = time.perf_counter() if log_info else 0.0
 
         parsed = YAMLRequestParser.parse(yaml_prompt)
-        ics = self._builder.build(parsed)
-        if "trace_id" not in ics.meta:
-            ics.meta["trace_id"] = trace_id
+        trace_id = self._resolve_trace_id(parsed)
+        if log_info:
+            logger.info("处理请求 trace_id=%s dry_run=%s", trace_id, dry_run)
+        ics = self._builder.build(parsed, trace_id=trace_id)
+        # 负载只构建一次：dry_run/调试返回与 _send 内的重试都复用同一个字典
         openai_payload = OpenAIAdapter.to_chat(ics)
 
         if dry_run:
             return {"ics_request": ics.to_payload(), "openai_request": openai_payload}
 
-        resp = self._send(openai_payload, ics.meta.get("trace_id"))
-        logger.info("完成 trace_id=%s 耗时=%.2fs", trace_id, time.time() - start)
+        resp = self._send(openai_payload, trace_id)
+        if log_info:
+            logger.info("完成 trace_id=%s 耗时=%.2fs", trace_id, time.perf_counter() - start)
 
-        result = self._extract_result(resp, ics.format_config)
         if not include_debug:
-            return result
-        return {"result": result, "ics_request": ics.to_payload(), "openai_request": openai_payload, "response": resp.model_dump() if hasattr(resp, "model_dump") else resp}
+            return self._extract_result(resp, ics.format_config)
+        # 调试模式只序列化一次响应，并基于该字典提取结果
+        resp_dict = resp.model_dump() if hasattr(resp, "model_dump") else resp
+        result = self._extract_result(resp_dict, ics.format_config)
+        return {"result": result, "ics_request": ics.to_payload(), "openai_request": openai_payload, "response": resp_dict}
 
     def _create_openai_client(self):
-        kwargs = {"api_key": self._config.api_key, "base_url": self._config.base_url}
-        if self._config.organization:
-            kwargs["organization"] = self._config.organization
-        return OpenAI(**kwargs)
+        return OpenAI(**self._client_kwargs(), http_client=self._http_client)
 
     def _send(self, payload: Dict[str, Any], trace_id: Optional[str]):
-        @_retry(self._retry_config, is_async=False)
+        @_retry(self._retry_config, is_async=False, retry_on=_is_retryable)
         def _call():
             try:
                 return self._openai_client.chat.completions.create(**payload)
@@ -173,47 +272,83 @@ class LLMClient(_BaseLLMClient):
         self._record_usage(resp, trace_id)
         return resp
 
+    def close(self) -> None:
+        self._builder.close()
+        if self._owns_http_client:
+            self._http_client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 class AsyncLLMClient(_BaseLLMClient):
     """异步 LLM 客户端。"""
-    def __init__(self, config: LLMAPIConfig, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None):
-        super().__init__(config, recorder, retry_config)
+    def __init__(
+        self,
+        config: LLMAPIConfig,
+        recorder: Optional[UsageRecorder] = None,
+        retry_config: Optional[RetryConfig] = None,
+        *,
+        http_client: Optional[httpx.AsyncClient] = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    ):
+        super().__init__(
+            config,
+            recorder,
+            retry_config,
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        # 传入的 http_client 由调用方负责关闭，便于多个客户端共享连接池
+        self._owns_http_client = http_client is None
+        # DefaultAsyncHttpxClient 保留 SDK 自身的默认设置（超时、follow_redirects 等），只覆盖连接池上限
+        self._http_client = http_client or openai.DefaultAsyncHttpxClient(limits=self._limits)
         self._openai_client = self._create_openai_client()
 
     @classmethod
-    def from_env(cls, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None):
-        return cls(LLMAPIConfig.from_env(), recorder, retry_config)
+    def from_env(cls, recorder: Optional[UsageRecorder] = None, retry_config: Optional[RetryConfig] = None, **kwargs: Any):
+        return cls(LLMAPIConfig.from_env(), recorder, retry_config, **kwargs)
 
-    async def invoke_from_yaml(self, yaml_prompt: str, *, dry_run: bool = False, include_debug: bool = False) -> Union[Any, Dict[str, Any]]:
-        start = time.time()
-        trace_id = str(uuid.uuid4())
-        logger.info("异步处理 trace_id=%s dry_run=%s", trace_id, dry_run)
+    async def invoke_from_yaml(self, yaml_prompt: Union[str, os.PathLike[str]], *, dry_run: bool = False, include_debug: bool = False) -> Union[Any, Dict[str, Any]]:
+        # INFO 未开启时跳过计时与日志调用
+        log_info = logger.isEnabledFor(logging.INFO)
+        start = time.perf_counter() if log_info else 0.0
 
         parsed = YAMLRequestParser.parse(yaml_prompt)
-        ics = self._builder.build(parsed)
-        if "trace_id" not in ics.meta:
-            ics.meta["trace_id"] = trace_id
+        trace_id = self._resolve_trace_id(parsed)
+        if log_info:
+            logger.info("异步处理 trace_id=%s dry_run=%s", trace_id, dry_run)
+        if self._builder.has_images(parsed):
+            # 图片读取/下载是阻塞 I/O，放到线程中执行以免阻塞事件循环
+            ics = await asyncio.to_thread(self._builder.build, parsed, trace_id=trace_id)
+        else:
+            ics = self._builder.build(parsed, trace_id=trace_id)
+        # 负载只构建一次：dry_run/调试返回与 _send 内的重试都复用同一个字典
         openai_payload = OpenAIAdapter.to_chat(ics)
 
         if dry_run:
             return {"ics_request": ics.to_payload(), "openai_request": openai_payload}
 
-        resp = await self._send(openai_payload, ics.meta.get("trace_id"))
-        logger.info("异步完成 trace_id=%s 耗时=%.2fs", trace_id, time.time() - start)
+        resp = await self._send(openai_payload, trace_id)
+        if log_info:
+            logger.info("异步完成 trace_id=%s 耗时=%.2fs", trace_id, time.perf_counter() - start)
 
-        result = self._extract_result(resp, ics.format_config)
         if not include_debug:
-            return result
-        return {"result": result, "ics_request": ics.to_payload(), "openai_request": openai_payload, "response": resp.model_dump() if hasattr(resp, "model_dump") else resp}
+            return self._extract_result(resp, ics.format_config)
+        # 调试模式只序列化一次响应，并基于该字典提取结果
+        resp_dict = resp.model_dump() if hasattr(resp, "model_dump") else resp
+        result = self._extract_result(resp_dict, ics.format_config)
+        return {"result": result, "ics_request": ics.to_payload(), "openai_request": openai_payload, "response": resp_dict}
 
     def _create_openai_client(self):
-        kwargs = {"api_key": self._config.api_key, "base_url": self._config.base_url}
-        if self._config.organization:
-            kwargs["organization"] = self._config.organization
-        return AsyncOpenAI(**kwargs)
+        return AsyncOpenAI(**self._client_kwargs(), http_client=self._http_client)
 
     async def _send(self, payload: Dict[str, Any], trace_id: Optional[str]):
-        @_retry(self._retry_config, is_async=True)
+        @_retry(self._retry_config, is_async=True, retry_on=_is_retryable)
         async def _call():
             try:
                 return await self._openai_client.chat.completions.create(**payload)
@@ -235,5 +370,11 @@ class AsyncLLMClient(_BaseLLMClient):
     async def __aenter__(self):
         return self
 
+    async def aclose(self) -> None:
+        # builder.close() 会等待图片线程池结束并关闭 requests Session，放到线程中执行，避免阻塞事件循环
+        await asyncio.to_thread(self._builder.close)
+        if self._owns_http_client:
+            await self._openai_client.close()
+
     async def __aexit__(self, *args):
-        await self._openai_client.close()
+        await self.aclose()
@@ -16,20 +16,29 @@ class LLMAPIConfig:
     base_url: str
     default_model: Optional[str]
     organization: Optional[str]
+    # 在线图片是否下载后内联为 base64；None 表示按 base_url 自动判断（仅 Gemini 兼容接口内联）
+    inline_remote_images: Optional[bool] = None
 
     @classmethod
     def from_env(cls) -> "LLMAPIConfig":
+        # 绑定一次 os.environ，每个键只查找、strip 一次
+        env = os.environ
+
         def require(key: str) -> str:
-            value = os.environ.get(key)
-            if not value or not value.strip():
+            value = env.get(key)
+            if not value or not (value := value.strip()):
                 raise LLMConfigError(f"缺少环境变量: {key}")
-            return value.strip()
+            return value
+
+        inline_str = env.get("LLM_INLINE_REMOTE_IMAGES", "").strip().lower()
+        inline_remote_images = (inline_str in ("true", "1", "yes", "on")) if inline_str else None
 
         return cls(
             api_key=require("LLM_API_KEY"),
             base_url=require("LLM_API_BASE"),
-            default_model=os.environ.get("LLM_MODEL"),
-            organization=os.environ.get("LLM_ORG"),
+            default_model=env.get("LLM_MODEL"),
+            organization=env.get("LLM_ORG"),
+            inline_remote_images=inline_remote_images,
         )
 
 
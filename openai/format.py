@@ -1,52 +1,79 @@
 """格式处理器（指令构建 + 响应校验）。"""
 from __future__ import annotations
 import json
+import threading
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Tuple
 
 from llm.exceptions import LLMValidationError
 from llm.models import ICSMessage
+from llm.utils import _json_dumps, _json_loads
+
+
+# 固定格式的指令消息在导入时构建一次；json_schema 依赖 schema 内容，走单独路径
+_FMT_TABLE: Dict[str, Tuple[ICSMessage, ...]] = {
+    "text": (),
+    "markdown": (ICSMessage(role="user", content="请确保回应使用 Markdown 的标题或列表组织内容，避免纯文本。"),),
+    "json": (ICSMessage(role="user", content="请仅输出合法 JSON，不要附加任何说明或代码块。"),),
+}
 
 
 class FormatHandler:
     """格式处理器（指令构建 + 响应校验）。"""
-    _FORMAT_MESSAGE_CACHE: Dict[str, Tuple[ICSMessage, ...]] = {}
+    _FORMAT_CACHE_MAX = 128
+    # 规范化 key（schema 的 sort_keys JSON）-> 指令消息，LRU 有界
+    _FORMAT_MESSAGE_CACHE: "OrderedDict[str, Tuple[ICSMessage, ...]]" = OrderedDict()
+    # id(schema) -> (schema, 指令消息)；持有 schema 的强引用，保证 id 在条目存活期间不被复用
+    _SCHEMA_ID_CACHE: "OrderedDict[int, Tuple[Any, Tuple[ICSMessage, ...]]]" = OrderedDict()
+    _CACHE_LOCK = threading.Lock()
 
     @staticmethod
     def build_messages(cfg: Optional[Dict[str, Any]]) -> List[ICSMessage]:
         if not cfg:
             return []
-        t = cfg.get("type")
+        fixed = _FMT_TABLE.get(cfg.get("type"))
+        if fixed is not None:
+            return list(fixed)
+        return FormatHandler._build_schema_messages(cfg)
+
+    @staticmethod
+    def _build_schema_messages(cfg: Dict[str, Any]) -> List[ICSMessage]:
+        if cfg.get("type") != "json_schema":
+            return []
+        schema = cfg.get("schema")
+        id_cache = FormatHandler._SCHEMA_ID_CACHE
+        # 同一 schema 对象被复用时，跳过 JSON 规范化
+        with FormatHandler._CACHE_LOCK:
+            hit = id_cache.get(id(schema))
+            if hit is not None and hit[0] is schema:
+                id_cache.move_to_end(id(schema))
+                return list(hit[1])
+
         cache_key = FormatHandler._cache_key(cfg)
-        if cache_key:
-            cached = FormatHandler._FORMAT_MESSAGE_CACHE.get(cache_key)
+        with FormatHandler._CACHE_LOCK:
+            cached = FormatHandler._FORMAT_MESSAGE_CACHE.get(cache_key) if cache_key else None
             if cached is not None:
-                return list(cached)
-        system_content = None
-        if t == "markdown":
-            system_content = None
-        elif t == "json":
-            system_content = None
-        elif t == "json_schema":
-            schema_text = json.dumps(cfg.get("schema"), ensure_ascii=False) if cfg.get("schema") else ""
-            if schema_text:
-                system_content = None
-        user_content = None
-        if t == "markdown":
-            user_content = "请确保回应使用 Markdown 的标题或列表组织内容，避免纯文本。"
-        elif t == "json":
-            user_content = "请仅输出合法 JSON，不要附加任何说明或代码块。"
-        elif t == "json_schema":
-            schema_text = json.dumps(cfg.get("schema"), ensure_ascii=False) if cfg.get("schema") else ""
-            if schema_text:
-                user_content = f"请严格按照以下 JSON Schema 返回完整字段: {schema_text}"
-        messages: List[ICSMessage] = []
-        if system_content:
-            messages.append(ICSMessage(role="system", content=system_content))
-        if user_content:
-            messages.append(ICSMessage(role="user", content=user_content))
-        if cache_key:
-            FormatHandler._FORMAT_MESSAGE_CACHE[cache_key] = tuple(messages)
-        return messages
+                FormatHandler._FORMAT_MESSAGE_CACHE.move_to_end(cache_key)
+        if cached is None:
+            messages: List[ICSMessage] = []
+            if schema:
+                # 指令文本固定使用标准库 json：输出不随是否安装 orjson 而变，保证提示词字节稳定（前缀缓存）
+                schema_text = json.dumps(schema, ensure_ascii=False)
+                messages.append(ICSMessage(role="user", content=f"请严格按照以下 JSON Schema 返回完整字段: {schema_text}"))
+            cached = tuple(messages)
+            if cache_key:
+                FormatHandler._cache_put(FormatHandler._FORMAT_MESSAGE_CACHE, cache_key, cached)
+        if isinstance(schema, dict):
+            FormatHandler._cache_put(id_cache, id(schema), (schema, cached))
+        return list(cached)
+
+    @staticmethod
+    def _cache_put(cache: "OrderedDict[Any, Any]", key: Any, value: Any) -> None:
+        with FormatHandler._CACHE_LOCK:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > FormatHandler._FORMAT_CACHE_MAX:
+                cache.popitem(last=False)
 
     @staticmethod
     def response_format(cfg: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
@@ -77,7 +104,7 @@ class FormatHandler:
             data = v
         elif isinstance(v, str):
             try:
-                data = json.loads(v)
+                data = _json_loads(v)
             except json.JSONDecodeError as e:
                 raise LLMValidationError("返回内容不是合法 JSON") from e
         else:
@@ -112,7 +139,7 @@ class FormatHandler:
         if fmt_type == "json_schema":
             schema = cfg.get("schema")
             try:
-                schema_repr = json.dumps(schema, ensure_ascii=False, sort_keys=True)
+                schema_repr = _json_dumps(schema, sort_keys=True)
             except (TypeError, ValueError):
                 schema_repr = repr(schema)
             name = cfg.get("name") or ""
@@ -19,13 +19,10 @@
 
 import logging
 
-# 配置日志
+# 库本身不在导入时配置全局日志；需要控制台日志时设置 OPENLIST_LOG=1
+# （创建 OpenListClient 时生效），或由调用方自行调用 logging.basicConfig
 logger = logging.getLogger(__name__)
-if not logger.handlers:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
-    )
+logger.addHandler(logging.NullHandler())
 
 # 导出主要 API
 from .client import OpenListClient
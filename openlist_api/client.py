@@ -1,14 +1,31 @@
 """OpenList 客户端实现。"""
 from __future__ import annotations
+import hashlib
+import json
 import logging
+import mmap
 import os
+import re
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 from urllib.parse import quote
 
 import requests
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import blake3
+except ImportError:  # pragma: no cover - optional dependency
+    blake3 = None
+
 from .config import OpenListConfig
 from .exceptions import (
     OpenListAPIError,
@@ -24,6 +41,66 @@ from .utils import (
 
 logger = logging.getLogger(__name__)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# 无需 URL 编码的路径字符
+_SAFE_PATH_RE = re.compile(r"[A-Za-z0-9_./~-]+")
+# 不小于该大小的文件通过 mmap 上传
+_MMAP_MIN_SIZE = 64 * 1024
+# 上传后创建分享失败（文件未被索引）时的重试间隔（秒）
+_SHARE_RETRY_DELAYS = (0.02, 0.05, 0.1, 0.2, 0.5)
+# 上传缓存（内容摘要 -> 分享链接）与摘要缓存（路径+mtime+大小 -> 摘要）的最大条目数
+_UPLOAD_CACHE_MAX = 512
+
+
+def _file_digest(path: str) -> str:
+    """计算文件内容摘要（附带文件大小），大文件通过 mmap 读取避免整体载入内存。
+
+    安装了 blake3 时使用 BLAKE3（SIMD 加速），否则使用 BLAKE2b-128；摘要只作进程内缓存键。
+    """
+    h = blake3.blake3() if blake3 is not None else hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= _MMAP_MIN_SIZE:
+            # 映射后整体交给 hashlib，不产生分块 bytes 拷贝，且哈希期间释放 GIL
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+        else:
+            data = f.read()
+            size = len(data)
+            h.update(data)
+    return f"{h.hexdigest()}:{size}"
+
+
+def _dumps(payload: Any) -> bytes:
+    """序列化请求体，安装了 orjson 时使用 orjson。"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def _loads(response: requests.Response) -> Any:
+    """解析响应 JSON，安装了 orjson 时使用 orjson。
+
+    解析失败时抛出 requests 的 InvalidJSONError（RequestException 子类），
+    与 ``response.json()`` 一样会被各方法的 RequestException 分支处理。
+    """
+    if orjson is None:
+        return response.json()
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
+        raise requests.exceptions.InvalidJSONError(str(e), response=response) from e
+
+
+def _maybe_configure_logging() -> None:
+    """OPENLIST_LOG 开启且根 logger 尚未配置时，输出 INFO 级别控制台日志。"""
+    enabled = os.environ.get("OPENLIST_LOG", "").strip().lower() in ("1", "true", "yes", "on")
+    if enabled and not logging.getLogger().handlers:
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+        )
+
 
 class OpenListClient:
     """OpenList API 客户端。"""
@@ -35,9 +112,18 @@ class OpenListClient:
         Args:
             config: OpenList 配置
         """
+        _maybe_configure_logging()
         self.config = config
         self._token: Optional[str] = None
         self._session = requests.Session()
+        # 本客户端已创建（或确认存在）的远程目录
+        self._known_dirs: set[str] = set()
+        # 图片内容摘要 -> (远程路径, 分享链接)，避免重复上传相同图片
+        # LRU 有界；upload_images 会在线程池中并发访问，读写均持 _cache_lock
+        self._upload_cache: "OrderedDict[str, tuple[str, str]]" = OrderedDict()
+        # (路径, mtime_ns, 大小) -> 内容摘要，同一未修改文件再次上传时无需重新读取计算
+        self._digest_cache: "OrderedDict[tuple[str, int, int], str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     @classmethod
     def from_env(cls) -> OpenListClient:
@@ -88,10 +174,10 @@ class OpenListClient:
             payload["otp_code"] = self.config.otp_code
 
         try:
-            response = self._session.post(url, json=payload)
+            response = self._session.post(url, data=_dumps(payload), headers=_JSON_HEADERS)
             response.raise_for_status()
 
-            data = response.json()
+            data = _loads(response)
 
             # 检查响应状态
             if data.get("code") != 200:
@@ -133,17 +219,17 @@ class OpenListClient:
         headers = self._get_headers(with_auth=True)
 
         try:
-            response = self._session.post(url, json=payload, headers=headers)
+            response = self._session.post(url, data=_dumps(payload), headers=headers)
             response.raise_for_status()
 
-            data = response.json()
+            data = _loads(response)
 
             # 检查响应状态
             if data.get("code") == 200:
-                logger.debug(f"目录创建成功: {path}")
+                logger.debug("目录创建成功: %s", path)
             elif data.get("code") == 400 and "请求有误" in data.get("message", ""):
                 # 目录可能已存在，不视为错误
-                logger.debug(f"目录可能已存在: {path}")
+                logger.debug("目录可能已存在: %s", path)
             else:
                 raise OpenListAPIError(
                     f"创建目录失败: {data.get('message', '未知错误')}",
@@ -161,16 +247,18 @@ class OpenListClient:
         Args:
             file_path: 完整文件路径
         """
-        parent_dirs = get_all_parent_dirs(file_path)
+        # 已确认存在的目录不再重复请求 mkdir
+        known_dirs = self._known_dirs
+        parent_dirs = [d for d in get_all_parent_dirs(file_path) if d not in known_dirs]
 
         for dir_path in parent_dirs:
             try:
                 self.create_directory(dir_path)
             except OpenListAPIError as e:
                 # 如果目录已存在，忽略错误
-                if "已存在" in str(e) or "请求有误" in str(e):
-                    continue
-                raise
+                if "已存在" not in str(e) and "请求有误" not in str(e):
+                    raise
+            known_dirs.add(dir_path)
 
     def upload_file(self, local_path: str, remote_path: str) -> None:
         """
@@ -195,8 +283,12 @@ class OpenListClient:
 
         url = f"{self.config.url}/api/fs/put"
 
-        # URL 编码远程路径
-        encoded_path = quote(remote_path, safe='')
+        # URL 编码远程路径；生成的路径通常只含安全字符，此时无需逐字符转义
+        # （"/" 保持原样，Alist 会按路径解码）
+        if _SAFE_PATH_RE.fullmatch(remote_path):
+            encoded_path = remote_path
+        else:
+            encoded_path = quote(remote_path, safe='/')
 
         # 设置请求头
         headers = {
@@ -206,26 +298,33 @@ class OpenListClient:
             "As-Task": "false",
         }
 
-        logger.debug(f"上传请求 URL: {url}")
-        logger.debug(f"原始路径: {remote_path}")
-        logger.debug(f"编码后路径: {encoded_path}")
-        logger.debug(f"上传请求头: {headers}")
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            logger.debug(
+                "上传请求 URL: %s\n原始路径: %s\n编码后路径: %s\n上传请求头: %s",
+                url, remote_path, encoded_path, headers,
+            )
 
         try:
-            # 以二进制流模式上传文件
             with open(local_path, "rb") as f:
-                response = self._session.put(
-                    url,
-                    data=f,
-                    headers=headers,
-                )
-
-                logger.debug(f"响应状态码: {response.status_code}")
-                logger.debug(f"响应内容: {response.text}")
+                size = os.fstat(f.fileno()).st_size
+                if size < _MMAP_MIN_SIZE:
+                    # 小文件：以二进制流模式上传
+                    response = self._session.put(url, data=f, headers=headers)
+                else:
+                    # 大文件：内存映射后以 memoryview 整体交给 socket 发送，
+                    # 避免逐块 read() 产生的 bytes 拷贝
+                    headers["Content-Length"] = str(size)
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                        response = self._session.put(url, data=view, headers=headers)
+
+                # response.text 需要解码响应体，仅在 DEBUG 开启时读取
+                if debug_enabled:
+                    logger.debug("响应状态码: %s\n响应内容: %s", response.status_code, response.text)
 
                 response.raise_for_status()
 
-                data = response.json()
+                data = _loads(response)
 
                 # 检查响应状态
                 if data.get("code") != 200:
@@ -233,7 +332,7 @@ class OpenListClient:
                         f"上传文件失败: {data.get('message', '未知错误')}",
                     )
 
-                logger.info(f"文件上传成功: {remote_path}")
+                logger.info("文件上传成功: %s", remote_path)
 
         except requests.RequestException as e:
             raise OpenListUploadError(f"上传文件请求失败: {str(e)}") from e
@@ -281,19 +380,22 @@ class OpenListClient:
 
         headers = self._get_headers(with_auth=True)
 
-        logger.debug(f"创建分享请求 URL: {url}")
-        logger.debug(f"创建分享请求体: {payload}")
-        logger.debug(f"创建分享请求头: {headers}")
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            logger.debug(
+                "创建分享请求 URL: %s\n创建分享请求体: %s\n创建分享请求头: %s",
+                url, payload, headers,
+            )
 
         try:
-            response = self._session.post(url, json=payload, headers=headers)
+            response = self._session.post(url, data=_dumps(payload), headers=headers)
 
-            logger.debug(f"创建分享响应状态码: {response.status_code}")
-            logger.debug(f"创建分享响应内容: {response.text}")
+            if debug_enabled:
+                logger.debug("创建分享响应状态码: %s\n创建分享响应内容: %s", response.status_code, response.text)
 
             response.raise_for_status()
 
-            data = response.json()
+            data = _loads(response)
 
             # 检查响应状态
             if data.get("code") != 200:
@@ -313,7 +415,7 @@ class OpenListClient:
             # 手动构建分享链接
             share_url = f"{self.config.url}/sd/{share_id}"
 
-            logger.info(f"分享创建成功: {share_url}")
+            logger.info("分享创建成功: %s", share_url)
 
             return share_id, share_url
 
@@ -325,7 +427,7 @@ class OpenListClient:
         上传图片并返回分享直链。
 
         这是主要的公共方法，封装了完整的上传流程：
-        1. 验证本地文件
+        1. 验证本地文件（相同内容已上传过时直接返回之前的分享链接）
         2. 生成远程路径（按年/月组织）
         3. 登录
         4. 创建必要的目录
@@ -344,7 +446,17 @@ class OpenListClient:
             OpenListError: 上传或分享失败
         """
         # 验证文件存在
-        validate_file_exists(local_path)
+        st = validate_file_exists(local_path)
+
+        # 相同内容已上传过时直接复用分享链接
+        digest = self._digest_for(local_path, st)
+        with self._cache_lock:
+            cached = self._upload_cache.get(digest)
+            if cached is not None:
+                self._upload_cache.move_to_end(digest)
+        if cached is not None:
+            logger.info("图片内容已上传过，复用分享链接: %s -> %s", local_path, cached[1])
+            return cached[1]
 
         # 获取文件名
         filename = os.path.basename(local_path)
@@ -355,20 +467,86 @@ class OpenListClient:
             filename
         )
 
-        logger.info(f"开始上传: {local_path} -> {remote_path}")
+        logger.info("开始上传: %s -> %s", local_path, remote_path)
 
         # 上传文件
         self.upload_file(local_path, remote_path)
 
-        # 等待一下让 Alist 索引文件
-        time.sleep(0.5)
+        # 创建分享链接：文件刚上传时 Alist 可能尚未完成索引，
+        # 此时按指数退避重试，而不是固定等待
+        for delay in _SHARE_RETRY_DELAYS:
+            try:
+                _, share_url = self.create_share([remote_path])
+                break
+            except OpenListAPIError as e:
+                message = str(e).lower()
+                if "not found" not in message and "不存在" not in message:
+                    raise
+                logger.debug("文件尚未被索引，%.2fs 后重试创建分享: %s", delay, remote_path)
+                time.sleep(delay)
+        else:
+            _, share_url = self.create_share([remote_path])
+
+        with self._cache_lock:
+            self._cache_put(self._upload_cache, digest, (remote_path, share_url))
+        logger.info("图片上传完成，分享链接: %s", share_url)
+
+        return share_url
 
-        # 创建分享链接
-        _, share_url = self.create_share([remote_path])
+    def _digest_for(self, local_path: str, st: os.stat_result) -> str:
+        """返回文件内容摘要；路径、mtime 与大小均未变化时复用上次的结果。"""
+        key = (os.path.abspath(local_path), st.st_mtime_ns, st.st_size)
+        with self._cache_lock:
+            digest = self._digest_cache.get(key)
+            if digest is not None:
+                self._digest_cache.move_to_end(key)
+                return digest
+        digest = _file_digest(local_path)
+        with self._cache_lock:
+            self._cache_put(self._digest_cache, key, digest)
+        return digest
+
+    @staticmethod
+    def _cache_put(cache: OrderedDict, key: Any, value: Any) -> None:
+        """写入 LRU 缓存并淘汰最旧条目；调用方需持有 _cache_lock。"""
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > _UPLOAD_CACHE_MAX:
+            cache.popitem(last=False)
+
+    def upload_images(self, local_paths: list[str], max_workers: int = 4) -> list[str]:
+        """
+        批量上传图片并返回分享直链（顺序与输入一致）。
 
-        logger.info(f"图片上传完成，分享链接: {share_url}")
+        只登录一次，多张图片在线程池中并发上传，总耗时接近最慢的一张
+        而不是逐张累加。
 
-        return share_url
+        Args:
+            local_paths: 图片本地路径列表
+            max_workers: 最大并发上传数
+
+        Returns:
+            图片分享直链列表
+
+        Raises:
+            FileNotFoundError: 文件不存在
+            OpenListError: 任一图片上传或分享失败
+        """
+        if not local_paths:
+            return []
+
+        # 先登录，避免并发上传时重复登录
+        if not self._token:
+            self.login()
+
+        # 重复路径只上传一次，避免并发时同一文件被同时上传
+        unique_paths = list(dict.fromkeys(local_paths))
+        if len(unique_paths) == 1:
+            return [self.upload_image(unique_paths[0])] * len(local_paths)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_paths))) as pool:
+            urls = dict(zip(unique_paths, pool.map(self.upload_image, unique_paths)))
+        return [urls[path] for path in local_paths]
 
     def remove_files(self, dir_path: str, file_names: list[str]) -> None:
         """
@@ -395,10 +573,10 @@ class OpenListClient:
         headers = self._get_headers(with_auth=True)
 
         try:
-            response = self._session.post(url, json=payload, headers=headers)
+            response = self._session.post(url, data=_dumps(payload), headers=headers)
             response.raise_for_status()
 
-            data = response.json()
+            data = _loads(response)
 
             # 检查响应状态
             if data.get("code") != 200:
@@ -408,7 +586,15 @@ class OpenListClient:
                     response_data=data,
                 )
 
-            logger.info(f"文件删除成功: {dir_path} - {file_names}")
+            logger.info("文件删除成功: %s - %s", dir_path, file_names)
+
+            # 已删除文件的分享链接不再可用，从上传缓存中移除
+            with self._cache_lock:
+                if self._upload_cache:
+                    removed = {f"{dir_path.rstrip('/')}/{name}" for name in file_names}
+                    for digest, (remote_path, _) in list(self._upload_cache.items()):
+                        if remote_path in removed:
+                            del self._upload_cache[digest]
 
         except requests.RequestException as e:
             raise OpenListAPIError(f"删除文件请求失败: {str(e)}") from e
@@ -428,7 +614,7 @@ class OpenListClient:
         dir_path = str(path.parent)
         file_name = path.name
 
-        logger.info(f"删除文件: {file_path}")
+        logger.info("删除文件: %s", file_path)
 
         # 调用基础删除方法
         self.remove_files(dir_path, [file_name])
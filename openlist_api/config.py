@@ -19,12 +19,15 @@ class OpenListConfig:
     @classmethod
     def from_env(cls) -> OpenListConfig:
         """从环境变量加载配置。"""
+        # 绑定一次 os.environ，每个键只查找、strip 一次
+        env = os.environ
+
         def req(key: str) -> str:
             """获取必需的环境变量。"""
-            value = os.environ.get(key)
-            if not value or not value.strip():
+            value = env.get(key)
+            if not value or not (value := value.strip()):
                 raise OpenListConfigError(f"缺少环境变量: {key}")
-            return value.strip()
+            return value
 
         # 获取必需配置
         url = req("OPENLIST_URL")
@@ -33,7 +36,7 @@ class OpenListConfig:
         temp_upload_path = req("OPENLIST_TEMP_UPLOAD_PATH")
 
         # 获取可选配置
-        otp_code = os.environ.get("OPENLIST_OTP_CODE")
+        otp_code = env.get("OPENLIST_OTP_CODE")
         if otp_code:
             otp_code = otp_code.strip()
 
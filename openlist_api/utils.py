@@ -1,7 +1,24 @@
 """工具函数。"""
-from datetime import datetime
 from pathlib import Path
 import os
+import stat
+import time
+
+# (分钟序号, 年, 月)；同一分钟内的上传复用已格式化的年月，整体替换元组因此无需加锁
+_YEAR_MONTH_CACHE: tuple[int, str, str] = (-1, "", "")
+
+
+def _current_year_month() -> tuple[str, str]:
+    global _YEAR_MONTH_CACHE
+    now = time.time()
+    minute = int(now // 60)
+    cached = _YEAR_MONTH_CACHE
+    if cached[0] != minute:
+        # 与原先 datetime.now() 一致，按本地时间划分年月
+        t = time.localtime(now)
+        cached = (minute, f"{t.tm_year:04d}", f"{t.tm_mon:02d}")
+        _YEAR_MONTH_CACHE = cached
+    return cached[1], cached[2]
 
 
 def generate_date_path(base_path: str, filename: str) -> str:
@@ -18,9 +35,7 @@ def generate_date_path(base_path: str, filename: str) -> str:
     Returns:
         完整的文件路径
     """
-    now = datetime.now()
-    year = now.strftime("%Y")
-    month = now.strftime("%m")
+    year, month = _current_year_month()
 
     # 确保路径以 / 开头
     if not base_path.startswith("/"):
@@ -55,35 +70,35 @@ def get_all_parent_dirs(file_path: str) -> list[str]:
     Returns:
         按层级排序的目录列表，如 ['/temp_images', '/temp_images/2025', '/temp_images/2025/10']
     """
-    path = Path(file_path)
-    parents = []
-
-    # 获取文件所在目录
-    current = path.parent
-
-    # 收集所有父目录
-    while str(current) != '/' and str(current) != '.':
-        parents.append(str(current))
-        current = current.parent
-
-    # 反转列表，使其从根到叶排序
-    parents.reverse()
-
+    # 纯字符串切分，不创建 Path 对象；与 PurePosixPath 一致地忽略空段、"." 段和末尾的 /
+    parts = [part for part in file_path.split("/") if part and part != "."]
+    parents: list[str] = []
+    current = "" if file_path.startswith("/") else None
+    for part in parts[:-1]:
+        current = part if current is None else f"{current}/{part}"
+        parents.append(current)
     return parents
 
 
-def validate_file_exists(file_path: str) -> None:
+def validate_file_exists(file_path: str) -> os.stat_result:
     """
     验证文件是否存在。
 
     Args:
         file_path: 文件路径
 
+    Returns:
+        文件的 stat 结果，调用方可复用而无需再次 stat
+
     Raises:
         FileNotFoundError: 如果文件不存在
     """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"文件不存在: {file_path}")
+    # 一次 stat 同时判断存在性与文件类型（os.path.exists + isfile 会 stat 两次）
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        raise FileNotFoundError(f"文件不存在: {file_path}") from None
 
-    if not os.path.isfile(file_path):
+    if not stat.S_ISREG(st.st_mode):
         raise ValueError(f"路径不是文件: {file_path}")
+    return st
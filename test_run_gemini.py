@@ -1,5 +1,6 @@
 """极简测试脚本（Gemini 原生 SDK）。"""
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from gemini import LLMClient, load_env_file
 
@@ -20,11 +21,10 @@ generation:
     - search
 """
 
-print("=== 测试 1: 文本生成 ===")
-output1 = client.invoke_from_yaml(yaml_prompt_basic, dry_run=True, raw_response=False)
-# print(json.dumps(output1, indent=2, ensure_ascii=False))
-print(output1)
-print()
+# 各测试互不依赖：先登记到 tests，最后在线程池中并发执行，按登记顺序输出结果
+# （异步客户端暂不支持；同步客户端共享同一个 SDK 连接池，可多线程调用）
+tests = []
+tests.append(("测试 1: 文本生成", yaml_prompt_basic, {"dry_run": True, "raw_response": False}))
 
 # # 测试2：纯图片生成（image模式）
 # yaml_prompt_image_only = """sx 
@@ -38,11 +38,7 @@ print()
 #   think: 0
 # """
 
-# print("=== 测试 2: 纯图片生成（image模式）===")
-# output2 = client.invoke_from_yaml(yaml_prompt_image_only)
-# print("图片生成结果:")
-# print(json.dumps(output2, indent=2, ensure_ascii=False))
-# print()
+# tests.append(("测试 2: 纯图片生成（image模式）", yaml_prompt_image_only, {}))
 
 # # 测试3：文本+图片生成（both模式）
 # yaml_prompt_both = """
@@ -56,11 +52,7 @@ print()
 #   think: 0
 # """
 
-# print("=== 测试 3: 文本+图片生成（both模式）===")
-# output3 = client.invoke_from_yaml(yaml_prompt_both)
-# print("生成结果:")
-# print(json.dumps(output3, indent=2, ensure_ascii=False))
-# print()
+# tests.append(("测试 3: 文本+图片生成（both模式）", yaml_prompt_both, {}))
 
 # # 测试4：使用preset的图片生成
 # yaml_prompt_with_preset = """
@@ -76,10 +68,26 @@ print()
 #   think: 0
 # """
 
-# print("=== 测试 4: 使用preset的图片生成 ===")
-# output4 = client.invoke_from_yaml(yaml_prompt_with_preset)
-# print("生成结果:")
-# print(json.dumps(output4, indent=2, ensure_ascii=False))
-# print()
+# tests.append(("测试 4: 使用preset的图片生成", yaml_prompt_with_preset, {}))
+
+
+def run_test(test):
+    _, yaml_prompt, kwargs = test
+    try:
+        return client.invoke_from_yaml(yaml_prompt, **kwargs)
+    except Exception as e:  # noqa: BLE001 - 单个测试失败不影响其他测试
+        return e
+
+
+with ThreadPoolExecutor(max_workers=max(1, len(tests))) as pool:
+    outputs = list(pool.map(run_test, tests))
+
+for (name, _, _), output in zip(tests, outputs):
+    print(f"=== {name} ===")
+    if isinstance(output, Exception):
+        print(f"失败: {output}")
+    else:
+        print(output)
+    print()
 
 print("=== 所有测试完成 ===")
@@ -6,6 +6,8 @@
 3. 将 IMAGE_PATH 修改为实际的图片路径
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from llm_api import load_env_file
 from openlist_api import OpenListClient
 
@@ -31,29 +33,41 @@ except Exception as e:
 
 
 # 示例 2: 批量上传多张图片
-def batch_upload_images(image_paths: list[str]) -> dict[str, str]:
+def batch_upload_images(image_paths: list[str], max_workers: int = 8) -> dict[str, str]:
     """
-    批量上传图片。
+    批量上传图片（线程池并发，单张失败不影响其他图片）。
 
     Args:
         image_paths: 图片路径列表
+        max_workers: 最大并发上传数
 
     Returns:
-        字典，键为本地路径，值为上传后的 URL
+        字典，键为本地路径，值为上传后的 URL（失败为 None）
     """
     results = {}
+    if not image_paths:
+        return results
+
+    # 先登录一次，避免并发上传时各线程重复登录
+    client.login()
 
-    for path in image_paths:
-        try:
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(image_paths))) as pool:
+        futures = {}
+        for path in image_paths:
             print(f"正在上传: {path}")
-            url = client.upload_image(path)
-            results[path] = url
-            print(f"  成功: {url}")
-        except Exception as e:
-            print(f"  失败: {e}")
-            results[path] = None
-
-    return results
+            futures[pool.submit(client.upload_image, path)] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                url = future.result()
+                results[path] = url
+                print(f"  成功: {path} -> {url}")
+            except Exception as e:
+                print(f"  失败: {path} - {e}")
+                results[path] = None
+
+    # 按输入顺序返回
+    return {path: results[path] for path in image_paths}
 
 
 # 取消注释以下代码来测试批量上传